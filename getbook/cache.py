@@ -0,0 +1,169 @@
+import os
+import time
+import shutil
+import logging
+from collections import namedtuple
+from .core.utils import SHARD_NAME
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.getbook/1')
+
+# folders in cache_dir, every file in them is an entry, except in "book",
+# where every book directory is an entry
+CACHE_FOLDERS = ('data', 'img', 'raw', 'book')
+
+CacheEntry = namedtuple('CacheEntry', ['folder', 'path', 'size', 'used_at'])
+
+
+class CacheManager(object):
+    """Report and limit the size of the getbook cache.
+
+    Every cache hit touches the mtime of the entry, so that entries are
+    evicted in least recently used order.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_age=None):
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # max age in days
+        self.max_age = max_age
+
+    @classmethod
+    def from_config(cls, cache_dir, config):
+        return cls(
+            cache_dir,
+            max_bytes=parse_size(config.get('CACHE_MAX_BYTES')),
+            max_age=parse_age(config.get('CACHE_MAX_AGE')),
+        )
+
+    def iter_entries(self):
+        for name in CACHE_FOLDERS:
+            folder = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(folder):
+                continue
+            if name == 'book':
+                for uid in os.listdir(folder):
+                    entry = _dir_entry(name, os.path.join(folder, uid))
+                    if entry:
+                        yield entry
+            else:
+                for entry in _iter_file_entries(name, folder):
+                    yield entry
+
+    def stats(self):
+        rv = {name: {'count': 0, 'size': 0} for name in CACHE_FOLDERS}
+        for entry in self.iter_entries():
+            item = rv[entry.folder]
+            item['count'] += 1
+            item['size'] += entry.size
+        return rv
+
+    def prune(self, max_bytes=None, max_age=None, dry_run=False):
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_age is None:
+            max_age = self.max_age
+
+        entries = sorted(self.iter_entries(), key=lambda o: o.used_at)
+        total = sum(e.size for e in entries)
+
+        if max_age is not None:
+            expired_at = time.time() - max_age * 86400
+        else:
+            expired_at = None
+
+        removed = []
+        for entry in entries:
+            expired = expired_at is not None and entry.used_at < expired_at
+            oversize = max_bytes is not None and total > max_bytes
+            if not expired and not oversize:
+                # entries are sorted by used_at, nothing left to expire
+                break
+            if not dry_run:
+                _remove(entry.path)
+            total -= entry.size
+            removed.append(entry)
+
+        images = [e.path for e in removed if e.folder == 'img']
+        if images and not dry_run:
+            from .ebook.index import get_index
+            image_dir = os.path.join(self.cache_dir, 'img')
+            get_index(image_dir).discard(images)
+
+        if removed:
+            log.info('Pruned {} cache entries, {} bytes'.format(
+                len(removed), sum(e.size for e in removed)))
+        return removed
+
+
+def parse_size(value):
+    if value is None or isinstance(value, int):
+        return value
+
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def parse_age(value):
+    # days, config files may have them as strings, e.g. "30"
+    if value is None:
+        return None
+    try:
+        age = float(value)
+    except (TypeError, ValueError):
+        age = -1
+    if age < 0:
+        raise RuntimeError('Invalid cache max age: {!r}'.format(value))
+    return age
+
+
+def format_size(size):
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024:
+            return '{:.1f}{}'.format(size, unit)
+        size /= 1024
+    return '{:.1f}T'.format(size)
+
+
+def _iter_file_entries(name, folder, pattern=SHARD_NAME):
+    for root, _, files in os.walk(folder):
+        for filename in files:
+            # only cache files, not indexes or temporary files
+            if pattern and not pattern.match(filename):
+                continue
+            filepath = os.path.join(root, filename)
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                continue
+            yield CacheEntry(name, filepath, st.st_size, st.st_mtime)
+
+
+def _dir_entry(name, folder):
+    if not os.path.isdir(folder):
+        return None
+
+    size = 0
+    used_at = 0
+    for entry in _iter_file_entries(name, folder, None):
+        size += entry.size
+        used_at = max(used_at, entry.used_at)
+    if not used_at:
+        used_at = os.stat(folder).st_mtime
+    return CacheEntry(name, folder, size, used_at)
+
+
+def _remove(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except OSError as e:
+        log.warn('Can not remove {}: {!r}'.format(path, e))
@@ -4,8 +4,8 @@ import logging
 import json
 import datetime
 from . import __version__ as version
-from .core import Book, Section
-from .gen import BookGen, filter_book_chapters
+from .core.models import Book, Section
+from .cache import CacheManager, CACHE_FOLDERS, parse_size, format_size
 
 
 def config_logging(verbose=False):
@@ -88,7 +88,52 @@ def parse_book_from_json(json_file, book_gen=None):
     return book
 
 
+def cache_main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='getbook cache')
+    parser.add_argument('--dir', help='cache directory')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('stats', help='print cache usage')
+    prune = commands.add_parser('prune', help='evict cache entries')
+    prune.add_argument('--max-size', help='max cache size, e.g. 500M, 2G')
+    prune.add_argument('--max-age', help='max age in days', type=float)
+    prune.add_argument('--dry-run', help='only print what would be removed',
+                       action='store_true')
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    manager = CacheManager.from_config(args.dir, config)
+
+    if args.command == 'stats':
+        stats = manager.stats()
+        total = 0
+        for name in CACHE_FOLDERS:
+            item = stats[name]
+            total += item['size']
+            print('{:<6} {:>8} entries {:>10}'.format(
+                name, item['count'], format_size(item['size'])))
+        print('{:<6} {:>27}'.format('total', format_size(total)))
+    elif args.command == 'prune':
+        max_bytes = parse_size(args.max_size)
+        max_age = args.max_age
+        if max_bytes is None and manager.max_bytes is None and \
+                max_age is None and manager.max_age is None:
+            print('Please specify --max-size or --max-age')
+            sys.exit(1)
+        removed = manager.prune(max_bytes, max_age, dry_run=args.dry_run)
+        if args.dry_run:
+            for entry in removed:
+                print(entry.path)
+        size = sum(e.size for e in removed)
+        print('Removed {} entries, {}'.format(len(removed), format_size(size)))
+    else:
+        parser.print_help()
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'cache':
+        return cache_main(sys.argv[2:])
+
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--version', help='print getbook version',
@@ -100,7 +145,11 @@ def main():
     parser.add_argument('-c', '--cover', help='add book cover URL')
     parser.add_argument('--force', help='force fetching from network',
                         action='store_true')
+    parser.add_argument('--offline', help='parse chapters from raw cache',
+                        action='store_true')
     parser.add_argument('--days', help='only fetch chapters in days', type=int)
+    parser.add_argument('--workers', help='fetch chapters concurrently',
+                        type=int)
     parser.add_argument('--epub', help='generate EPUB format ebook',
                         action='store_true')
     parser.add_argument('--mobi', help='generate MOBI format ebook',
@@ -115,10 +164,17 @@ def main():
         print('Please specify a file or URL')
         sys.exit(1)
 
+    # building needs most of the heavy dependencies, import them only here
+    from .gen import BookGen, filter_book_chapters
+
     config_logging(args.verbose)
     config = load_config()
     # TODO: kindlegen
     config['GENERATOR_KINDLEGEN'] = 'kindlegen'
+    if args.workers:
+        config['GENERATOR_WORKERS'] = args.workers
+    if args.offline:
+        config['GENERATOR_OFFLINE'] = True
     bg = BookGen(config=config)
 
     if args.url:
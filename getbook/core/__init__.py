@@ -1,4 +1,22 @@
-
+import importlib
 from .models import Chapter, Image, Book, Section
-from .core_parser import Parser, LXML_SPACE
-from .fallback_parser import FallbackParser
+
+# parsers pull in bs4 and lxml, they are imported on first access, so
+# that importing the models stays cheap
+_LAZY_NAMES = {
+    'Parser': 'core_parser',
+    'NotModified': 'core_parser',
+    'LXML_SPACE': 'core_parser',
+    'LXML_ENGINE': 'core_parser',
+    'FallbackParser': 'fallback_parser',
+    'RawStore': 'store',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_NAMES.get(name)
+    if module is None:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    module = importlib.import_module('.' + module, __name__)
+    return getattr(module, name)
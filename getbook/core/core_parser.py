@@ -3,16 +3,19 @@
 import re
 from urllib.parse import urljoin
 
-import requests
 from bs4 import BeautifulSoup
 from bs4 import Comment
 from bs4.builder import builder_registry
 from bs4.builder._lxml import LXMLTreeBuilder
 
+from . import fetcher
 from .post_clean import parse_content_and_attachments
 from .parse_lang import parse_lang_by_text
 from .utils import normalize_url, get_canonical_link
+from .text_cache import TextCache
+from .selector import RuleSelector
 from .models import Chapter
+from .lxml_engine import dom as lxml_dom, parse_meta as lxml_meta
 
 KILL_TAGS = [
     'button', 'input', 'select', 'textarea',
@@ -30,6 +33,8 @@ DEFAULT_USER_AGENT = (
 )
 CHARSET_PATTERN = re.compile(r'<meta.*(charset="?\w+"?).*?>', re.I)
 LXML_SPACE = 'lxml-space'
+BS4_ENGINE = 'bs4'
+LXML_ENGINE = 'lxml'
 
 
 class TreeBuilder(LXMLTreeBuilder):
@@ -41,11 +46,27 @@ class TreeBuilder(LXMLTreeBuilder):
 builder_registry.register(TreeBuilder)
 
 
+class NotModified(RuntimeError):
+    pass
+
+
 class Parser(object):
     NAME = None
     ENCODING = None
     USER_AGENT = DEFAULT_USER_AGENT
     SOUP_FEATURES = LXML_SPACE
+    # dom is a BeautifulSoup object with the bs4 engine, and an lxml
+    # ElementTree with the lxml engine, which is faster, parsers using
+    # it implement parse_lxml
+    ENGINE = BS4_ENGINE
+    # URLs matching this pattern are handled by this parser, site parsers
+    # that only set a pattern are matched together in one regex
+    URL_PATTERN = None
+
+    @classmethod
+    def check_url(cls, url):
+        if cls.URL_PATTERN is not None:
+            return cls.URL_PATTERN.search(url)
 
     @classmethod
     def normalize_url(cls, url):
@@ -54,11 +75,23 @@ class Parser(object):
     def __init__(self, url, content=None):
         self.url = url
         self.content = content
-
-    def _request(self, url):
+        # validators (etag, last_modified) of the content, set them before
+        # fetching to send a conditional request
+        self.validators = {}
+        # a RawStore to keep the fetched HTML
+        self.store = None
+        # lengths of texts in dom, shared by cleaning and scoring
+        self.text_cache = TextCache()
+
+    def _request(self, url, validators=None):
         user_agent = self.get_user_agent(url)
         headers = {'User-Agent': user_agent}
-        req = requests.get(url, timeout=5, headers=headers)
+        if validators:
+            headers.update(fetcher.get_conditional_headers(validators))
+        req = fetcher.get(url, timeout=5, headers=headers)
+
+        if req.status_code == 304:
+            raise NotModified(url)
 
         if req.status_code != 200:
             raise RuntimeError("Not available %s" % req.status_code)
@@ -96,7 +129,9 @@ class Parser(object):
         return None
 
     def fetch(self):
-        req = self._request(self.url)
+        url = self.url
+        req = self._request(url, self.validators)
+        self.validators = fetcher.get_validators(req.headers)
 
         if not self.ENCODING:
             if 'charset' in req.headers.get('content-type', '').lower():
@@ -114,12 +149,18 @@ class Parser(object):
         self.content = re.sub(r'\r\n|\r', '\n', req.text)
 
         # parse canonical link
-        link = get_canonical_link(self.dom)
+        if self.ENGINE == LXML_ENGINE:
+            link = lxml_meta.get_canonical_link(self.dom)
+        else:
+            link = get_canonical_link(self.dom)
         if link:
             self.url = link
         else:
             self.url = req.url
 
+        if self.store is not None:
+            self.store.save(url, self.url, self.content, req.headers)
+
     def before_parse(self):
         if self.content is None:
             self.fetch()
@@ -127,7 +168,13 @@ class Parser(object):
     def clean_content(self, content):
         return content
 
+    def parse_lxml(self):
+        raise NotImplementedError()
+
     def parse(self):
+        if self.ENGINE == LXML_ENGINE:
+            return self.parse_lxml()
+
         self.before_parse()
 
         # clean useless tags
@@ -152,10 +199,14 @@ class Parser(object):
 
         publisher = safe_strip(self.parse_publisher())
 
+        # nodes may be extracted by the parsers above
+        self.text_cache.clear()
+
         self.make_absolute_links(content_node)
         content, attachments = parse_content_and_attachments(
-            content_node, self.dom
+            content_node, self.dom, self.text_cache
         )
+        self.text_cache.clear()
         content = self.clean_content(content)
 
         if not summary and content_node:
@@ -175,7 +226,10 @@ class Parser(object):
         dom = getattr(self, '_dom', None)
         if dom is not None:
             return dom
-        dom = BeautifulSoup(self.content, self.SOUP_FEATURES)
+        if self.ENGINE == LXML_ENGINE:
+            dom = lxml_dom.parse_html(self.content)
+        else:
+            dom = BeautifulSoup(self.content, self.SOUP_FEATURES)
         self._dom = dom
         return self._dom
 
@@ -190,8 +244,8 @@ class Parser(object):
         return node
 
     def select_by_rules(self, rules):
-        for rule in rules:
-            for el in self.dom.select(rule):
+        for els in RuleSelector.compile(rules).select(self.dom):
+            for el in els:
                 yield el
 
     def urljoin(self, src):
@@ -24,9 +24,13 @@ from .parse_schema import (
     parse_ld_image,
 )
 from .core_parser import Parser
+from .selector import RuleSelector
 from .pre_clean import preclean
 
 GIST_URL = re.compile(r'https://gist\.github\.com/(?:(?:[^\/]+/.+)|\d+)\.js')
+ENTRY_TITLES = ('.hentry .entry-title',)
+# links to the page itself are titles
+LINK_TITLES = ('h1 a', 'h2 a', 'h3 a')
 
 
 class FallbackParser(Parser):
@@ -62,6 +66,11 @@ class FallbackParser(Parser):
                 div = self.create_attachment_tag('gist', src[:-3])
                 script.replace_with(div)
 
+    def parse_lxml(self):
+        # the lxml engine imports this module
+        from .lxml_engine.fallback_parser import FallbackExtractor
+        return FallbackExtractor(self).parse()
+
     def get_user_agent(self, url):
         if url.startswith('https://t.co'):
             return 'curl'
@@ -93,12 +102,12 @@ class FallbackParser(Parser):
     def parse_content(self):
         for node in self.select_by_rules(self.CONTENTS):
             if node:
-                preclean(node)
+                preclean(node, self.text_cache)
                 self._content = node
                 return node
 
-        preclean(self.dom)
-        self._content = guess_content(self.dom)
+        preclean(self.dom, self.text_cache)
+        self._content = guess_content(self.dom, self.text_cache)
         return self._content
 
     def parse_author(self):
@@ -169,7 +178,14 @@ class FallbackParser(Parser):
 
         doctitle = doc.get_text()
 
-        els = self.dom.select('.hentry .entry-title')
+        # the title rules are selected in one walk, tags are not extracted
+        # until a title is found
+        rules = ENTRY_TITLES + LINK_TITLES + tuple(self.OTHER_TITLES)
+        selected = list(RuleSelector.compile(rules).select(self.dom))
+        link_titles = selected[1:1 + len(LINK_TITLES)]
+        other_titles = selected[1 + len(LINK_TITLES):]
+
+        els = selected[0]
         if els and len(els) == 1:
             node = els[0]
             title = node.get_text()
@@ -177,17 +193,16 @@ class FallbackParser(Parser):
             return title
 
         # find absolute link title
-        rules = ['h1 a', 'h2 a', 'h3 a']
-        for rule in rules:
-            for el in self.dom.select(rule):
+        for els in link_titles:
+            for el in els:
                 href = el.get('href')
                 if href and self.urljoin(href) == self.url:
                     el.extract()
                     return el.get_text()
 
         possible_titles = []
-        for rule in self.OTHER_TITLES:
-            possible_titles.extend(self.dom.select(rule))
+        for els in other_titles:
+            possible_titles.extend(els)
 
         title = guess_title(possible_titles, doctitle, self.url)
         if title:
@@ -0,0 +1,215 @@
+# coding: utf-8
+
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+DEFAULT_HOST_CONCURRENCY = 2
+DEFAULT_HOST_DELAY = 0.25
+DEFAULT_BACKOFF = 5
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class HostScheduler(object):
+    """Limit concurrent connections and request rate per hostname.
+
+    Requests to different hosts never block each other, requests to the
+    same host are limited to ``concurrency`` at a time, and started at
+    least ``delay`` seconds apart. A new ``concurrency`` only applies to
+    hosts that have not been requested yet.
+    """
+
+    def __init__(self, concurrency=DEFAULT_HOST_CONCURRENCY,
+                 delay=DEFAULT_HOST_DELAY):
+        self.concurrency = concurrency
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def configure(self, concurrency=None, delay=None):
+        with self._lock:
+            if concurrency is not None:
+                self.concurrency = max(int(concurrency), 1)
+            if delay is not None:
+                self.delay = max(float(delay), 0)
+
+    @contextmanager
+    def acquire(self, url):
+        slot = self._get_slot(urlparse(url).hostname)
+        slot.semaphore.acquire()
+        try:
+            slot.wait(self.delay)
+            yield
+        finally:
+            slot.semaphore.release()
+
+    def backoff(self, url, seconds):
+        slot = self._get_slot(urlparse(url).hostname)
+        slot.postpone(seconds)
+
+    def _get_slot(self, host):
+        with self._lock:
+            slot = self._hosts.get(host)
+            if slot is None:
+                slot = _HostSlot(self.concurrency)
+                self._hosts[host] = slot
+            return slot
+
+
+class _HostSlot(object):
+    def __init__(self, concurrency):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._next_time = 0
+
+    def wait(self, delay):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + delay
+        if start > now:
+            time.sleep(start - now)
+
+    def postpone(self, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._next_time = max(self._next_time, until)
+
+
+class Transport(object):
+    """A shared :class:`requests.Session` with keep-alive connection
+    pools per host, retries with backoff and compressed responses.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_RETRY_BACKOFF):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._session = None
+
+    def configure(self, pool_size=None, retries=None, backoff=None):
+        with self._lock:
+            settings = (self.pool_size, self.retries, self.backoff)
+            if pool_size is not None:
+                self.pool_size = max(int(pool_size), 1)
+            if retries is not None:
+                self.retries = max(int(retries), 0)
+            if backoff is not None:
+                self.backoff = max(float(backoff), 0)
+            # the session may be in use, keep its connection pools
+            if settings != (self.pool_size, self.retries, self.backoff):
+                self._close()
+
+    @property
+    def session(self):
+        session = self._session
+        if session is not None:
+            return session
+
+        with self._lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _create_session(self):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=RETRY_STATUS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        # br is included when brotli is installed
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+
+scheduler = HostScheduler()
+transport = Transport()
+
+
+def configure(config):
+    scheduler.configure(
+        concurrency=config.get('GENERATOR_HOST_CONCURRENCY'),
+        delay=config.get('GENERATOR_HOST_DELAY'),
+    )
+    transport.configure(
+        pool_size=config.get('GENERATOR_HTTP_POOL_SIZE'),
+        retries=config.get('GENERATOR_HTTP_RETRIES'),
+        backoff=config.get('GENERATOR_HTTP_BACKOFF'),
+    )
+
+
+def get_session():
+    return transport.session
+
+
+def get(url, **kwargs):
+    with scheduler.acquire(url):
+        resp = transport.session.get(url, **kwargs)
+    throttle(url, resp)
+    return resp
+
+
+def throttle(url, resp):
+    # slow down when the server tells us we are too fast
+    if resp.status_code not in (429, 503):
+        return
+    value = resp.headers.get('Retry-After')
+    if value and value.isdigit():
+        seconds = int(value)
+    else:
+        seconds = DEFAULT_BACKOFF
+    scheduler.backoff(url, seconds)
+
+
+def get_validators(headers):
+    headers = CaseInsensitiveDict(headers)
+    validators = {}
+    etag = headers.get('ETag')
+    if etag:
+        validators['etag'] = etag
+    last_modified = headers.get('Last-Modified')
+    if last_modified:
+        validators['last_modified'] = last_modified
+    return validators
+
+
+def get_conditional_headers(validators):
+    headers = {}
+    etag = validators.get('etag')
+    if etag:
+        headers['If-None-Match'] = etag
+    last_modified = validators.get('last_modified')
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
@@ -0,0 +1,527 @@
+# coding: utf-8
+"""Helpers to work on lxml.html elements the way the BeautifulSoup tree
+built with :class:`getbook.core.core_parser.TreeBuilder` behaves, so
+that both engines produce the same chapters."""
+
+import re
+import shlex
+from lxml import etree
+
+from ..utils import USELESS_IDENTS
+from .. import selector as css
+
+Comment = etree.Comment
+ProcessingInstruction = etree.PI
+
+# strings of these ASCII spaces only are collapsed into one space or
+# newline, unless they are in a whitespace preserving tag
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+PRESERVE_WHITESPACE_TAGS = ('td', 'pre')
+
+# tags written as <br/> when they have no contents
+EMPTY_ELEMENT_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+])
+# strings in these tags are written without escaping
+CDATA_CONTAINING_TAGS = ('script', 'style')
+# the charset of <meta> is written as the output encoding
+OUTPUT_ENCODING = 'utf-8'
+META_CONTENT_CHARSET = re.compile(r'((^|;)\s*charset=)([^;]*)', re.M)
+
+# attributes that are a list of values split by whitespaces
+LIST_ATTRIBUTES = {
+    '*': ('class', 'accesskey', 'dropzone'),
+    'a': ('rel', 'rev'),
+    'link': ('rel', 'rev'),
+    'td': ('headers',),
+    'th': ('headers',),
+    'form': ('accept-charset',),
+    'object': ('archive',),
+    'area': ('rel',),
+    'icon': ('sizes',),
+    'iframe': ('sandbox',),
+    'output': ('for',),
+}
+WHITESPACE = re.compile(r'\s+')
+# attachment tags are created with a class string, which is not split
+# into a list, see Parser.create_attachment_tag
+ATTACHMENT_CLASS = re.compile(r'^tag tag-\S+$')
+
+ESCAPE_PATTERN = re.compile(r'[&<>]')
+ESCAPE_MAP = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+
+
+def parse_html(content):
+    """Parse HTML into an lxml ElementTree, which is the document, like
+    the BeautifulSoup object, <html> is its root element."""
+    parser = etree.HTMLParser()
+    try:
+        parser.feed(content)
+        root = parser.close()
+    except (UnicodeDecodeError, LookupError, etree.ParserError):
+        parser = etree.HTMLParser(encoding='utf8')
+        parser.feed(content.encode('utf8'))
+        root = parser.close()
+
+    if root is None:
+        # an empty document
+        root = etree.Element('html')
+    collapse_whitespace(root)
+    return root.getroottree()
+
+
+def collapse_whitespace(root):
+    preserved = 0
+    events = ('start', 'end', 'comment', 'pi')
+    for event, el in etree.iterwalk(root, events=events):
+        tag = el.tag
+        if event == 'start':
+            if tag in PRESERVE_WHITESPACE_TAGS:
+                preserved += 1
+            if not preserved:
+                el.text = _collapse(el.text)
+            continue
+
+        if event == 'end' and tag in PRESERVE_WHITESPACE_TAGS:
+            preserved -= 1
+        if not preserved:
+            el.tail = _collapse(el.tail)
+
+
+def _collapse(text):
+    if not text or text.strip(ASCII_SPACES):
+        return text
+    if '\n' in text:
+        return '\n'
+    return ' '
+
+
+def is_tag(node):
+    return isinstance(node.tag, str)
+
+
+def is_document(node):
+    return isinstance(node, etree._ElementTree)
+
+
+def iter_tags(node, *tags):
+    """Yield tags in node in document order, named one of ``tags``."""
+    if not tags:
+        tags = (etree.Element,)
+    if is_document(node):
+        return node.iter(*tags)
+    return node.iterdescendants(*tags)
+
+
+def find(node, *tags):
+    return next(iter_tags(node, *tags), None)
+
+
+def find_by_attribute(node, tag, key, value=True):
+    """Find the first tag like ``node.find(tag, attrs={key: value})`` of
+    BeautifulSoup, ``value=True`` matches any tag that has the attribute.
+    """
+    if tag is None:
+        tags = ()
+    else:
+        tags = (tag,)
+    for el in iter_tags(node, *tags):
+        if match_attribute(el, key, value):
+            return el
+    return None
+
+
+def match_attribute(node, key, value=True):
+    rv = get_attribute(node, key)
+    if value is True or rv is None:
+        return rv is not None
+    if isinstance(rv, list):
+        # a multi-valued attribute matches any of its values
+        return value in rv or ' '.join(rv) == value
+    return rv == value
+
+
+def first_child(node):
+    return next(node.iterchildren(etree.Element), None)
+
+
+def get_text(node, strip=False):
+    if is_document(node):
+        node = node.getroot()
+    if strip:
+        texts = (text.strip() for text in node.itertext())
+        return ''.join(text for text in texts if text)
+    return ''.join(node.itertext())
+
+
+def iter_strings(node):
+    """Yield strings in node, which are separated by tags."""
+    return node.itertext()
+
+
+def get_depth(node):
+    depth = 0
+    top = node
+    for top in node.iterancestors():
+        depth += 1
+    # the document (BeautifulSoup object) is a parent of <html>, removed
+    # elements are not in the document any more
+    if top is node.getroottree().getroot():
+        depth += 1
+    return depth
+
+
+def get_classes(node):
+    value = node.get('class')
+    if value is None:
+        return None
+    if ATTACHMENT_CLASS.match(value) and (
+            node.get('data-attrs') is not None or
+            node.get('data-attachment') is not None):
+        return value
+    return WHITESPACE.split(value)
+
+
+def get_attribute(node, key):
+    """Get the value of an attribute, a list of values for multi-valued
+    attributes."""
+    if key == 'class':
+        return get_classes(node)
+    value = node.get(key)
+    if value is not None and is_list_attribute(node.tag, key):
+        return WHITESPACE.split(value)
+    return value
+
+
+def is_list_attribute(tag, key):
+    if key in LIST_ATTRIBUTES['*']:
+        return True
+    return key in LIST_ATTRIBUTES.get(tag, ())
+
+
+def identities(node):
+    tokens = []
+    ident = node.get('id')
+    if ident:
+        tokens.append(ident)
+    classes = get_classes(node)
+    if classes:
+        tokens.extend(classes)
+    return [i.lower() for i in tokens if _is_valid_ident(i)]
+
+
+def _is_valid_ident(ident):
+    ident = ident.lower()
+    for k in USELESS_IDENTS:
+        if k in ident:
+            return False
+    return True
+
+
+def new_tag(name, attrs=None):
+    node = etree.Element(name)
+    if attrs:
+        for key in attrs:
+            node.set(key, attrs[key])
+    return node
+
+
+def extract(node):
+    parent = node.getparent()
+    if parent is None:
+        return node
+    # the tail is a sibling string of node, it stays in the tree
+    _append_text(parent, node.getprevious(), node.tail)
+    node.tail = None
+    parent.remove(node)
+    return node
+
+
+def unwrap(node):
+    parent = node.getparent()
+    if parent is None:
+        raise ValueError(
+            'Cannot replace an element with its contents when that'
+            ' element is not part of a tree.')
+    previous = node.getprevious()
+    _append_text(parent, previous, node.text)
+    if len(node):
+        last = node[-1]
+        last.tail = (last.tail or '') + (node.tail or '') or None
+    else:
+        _append_text(parent, previous, node.tail)
+    index = parent.index(node)
+    parent[index:index + 1] = node[:]
+    node.text = None
+    node.tail = None
+    return node
+
+
+def replace_with(node, new):
+    parent = node.getparent()
+    if parent is None:
+        raise ValueError(
+            'Cannot replace one element with another when the element'
+            ' to be replaced is not part of a tree.')
+    if new is node:
+        return node
+    extract(new)
+    tail = node.tail
+    node.tail = None
+    parent.replace(node, new)
+    new.tail = tail
+    return node
+
+
+def _append_text(parent, previous, text):
+    if not text:
+        return
+    if previous is None:
+        parent.text = (parent.text or '') + text
+    else:
+        previous.tail = (previous.tail or '') + text
+
+
+def find_all_next(node):
+    """Tags after the start of node, i.e. its descendants and the tags
+    after it in the document."""
+    nodes = list(node.iterdescendants(etree.Element))
+    while node is not None:
+        for sibling in node.itersiblings():
+            if is_tag(sibling):
+                nodes.append(sibling)
+                nodes.extend(sibling.iterdescendants(etree.Element))
+        node = node.getparent()
+    return nodes
+
+
+def to_html(node):
+    """Serialize node like str(tag) of BeautifulSoup."""
+    out = []
+    _write_node(node, out)
+    return ''.join(out)
+
+
+def inner_html(node):
+    out = []
+    _write_contents(node, out)
+    return ''.join(out)
+
+
+def _write_node(node, out):
+    # tags are closed from a stack, documents can be deeply nested
+    stack = [(node, False)]
+    while stack:
+        el, closing = stack.pop()
+        tag = el.tag
+        if closing:
+            out.append('</{}>'.format(tag))
+        elif tag is Comment:
+            out.append('<!--{}-->'.format(el.text or ''))
+        elif tag is ProcessingInstruction:
+            out.append('<?{} {}>'.format(el.target, el.text or ''))
+        elif tag in EMPTY_ELEMENT_TAGS and not len(el) and not el.text:
+            out.append('<{}{}/>'.format(tag, _format_attributes(el)))
+        else:
+            out.append('<{}{}>'.format(tag, _format_attributes(el)))
+            _write_string(el, el.text, out)
+            stack.append((el, True))
+            stack.extend((child, False) for child in reversed(el))
+            continue
+
+        # the tail of node is not a part of it
+        if el is not node:
+            _write_string(el.getparent(), el.tail, out)
+
+
+def _write_contents(node, out):
+    _write_string(node, node.text, out)
+    for child in node:
+        _write_node(child, out)
+        _write_string(node, child.tail, out)
+
+
+def _write_string(parent, text, out):
+    if not text:
+        return
+    if parent is not None and parent.tag in CDATA_CONTAINING_TAGS:
+        out.append(text)
+    else:
+        out.append(ESCAPE_PATTERN.sub(_escape, text))
+
+
+def _escape(m):
+    return ESCAPE_MAP[m.group(0)]
+
+
+def _format_attributes(node):
+    if not len(node.attrib):
+        return ''
+    attrs = []
+    tag = node.tag
+    charset_key = None
+    if tag == 'meta':
+        charset_key = _get_meta_charset_key(node)
+
+    for key, value in sorted(node.attrib.items()):
+        if is_list_attribute(tag, key):
+            if key != 'class' or not isinstance(get_classes(node), str):
+                value = ' '.join(WHITESPACE.split(value))
+        elif key == charset_key == 'charset':
+            value = OUTPUT_ENCODING
+        elif key == charset_key == 'content':
+            value = META_CONTENT_CHARSET.sub(_replace_charset, value)
+        value = ESCAPE_PATTERN.sub(_escape, value)
+        attrs.append('{}={}'.format(key, _quote(value)))
+    return ' ' + ' '.join(attrs)
+
+
+def _get_meta_charset_key(node):
+    if node.get('charset') is not None:
+        return 'charset'
+    equiv = node.get('http-equiv')
+    if node.get('content') is not None and equiv is not None:
+        if equiv.lower() == 'content-type':
+            return 'content'
+    return None
+
+
+def _replace_charset(m):
+    return m.group(1) + OUTPUT_ENCODING
+
+
+def _quote(value):
+    if '"' in value:
+        if "'" in value:
+            return '"{}"'.format(value.replace('"', '&quot;'))
+        return "'{}'".format(value)
+    return '"{}"'.format(value)
+
+
+class Selector(object):
+    """A CSS selector compiled once, it selects the same tags in the same
+    order as ``Tag.select`` of BeautifulSoup."""
+
+    def __init__(self, selector):
+        self.selector = selector
+        if ',' in selector:
+            selectors = []
+            for value in selector.split(','):
+                value = value.strip()
+                if not value:
+                    raise ValueError(
+                        'Invalid group selection syntax: %s' % selector)
+                if value not in selectors:
+                    selectors.append(value)
+            self.groups = [Selector(value) for value in selectors]
+            self.steps = None
+        else:
+            self.groups = None
+            self.steps = _compile_steps(selector)
+
+    def select(self, node):
+        if self.groups is not None:
+            return _unique(
+                el for selector in self.groups for el in selector.select(node))
+
+        context = [node]
+        for combinator, tag_name, checker in self.steps:
+            candidates = (
+                el for ctx in context
+                for el in _iter_candidates(ctx, combinator, tag_name)
+            )
+            if checker is not None:
+                candidates = (el for el in candidates if checker(el))
+            context = _unique(candidates)
+        return context
+
+
+_selectors = {}
+
+
+def select(node, selector):
+    """Select tags in node, the document or an element, with a CSS
+    selector."""
+    compiled = _selectors.get(selector)
+    if compiled is None:
+        compiled = Selector(selector)
+        _selectors[selector] = compiled
+    return compiled.select(node)
+
+
+class RuleSelector(css.RuleSelector):
+    """The :class:`~getbook.core.selector.RuleSelector` of lxml trees."""
+
+    @staticmethod
+    def iter_children(node):
+        if is_document(node):
+            return iter((node.getroot(),))
+        return node.iterchildren(etree.Element)
+
+    @staticmethod
+    def get_name(node):
+        return node.tag
+
+    @staticmethod
+    def iter_attributes(node):
+        return node.keys()
+
+    @staticmethod
+    def get_attribute(node, key):
+        return get_attribute(node, key)
+
+    @staticmethod
+    def select_rule(dom, rule):
+        return select(dom, rule)
+
+
+def _unique(nodes):
+    rv = []
+    seen = set()
+    for el in nodes:
+        if el not in seen:
+            seen.add(el)
+            rv.append(el)
+    return rv
+
+
+def _compile_steps(selector):
+    tokens = shlex.split(selector)
+    if tokens[-1] in css.COMBINATORS:
+        raise ValueError(
+            'Final combinator "%s" is missing an argument.' % tokens[-1])
+
+    steps = []
+    combinator = None
+    for token in tokens:
+        if token in css.COMBINATORS:
+            combinator = token
+            continue
+        tag_name, checker = css.compile_token(token, get_attribute)
+        steps.append((combinator, tag_name, checker))
+        combinator = None
+    return steps
+
+
+def _iter_candidates(node, combinator, tag_name):
+    tag = tag_name or etree.Element
+    if combinator is None:
+        return iter_tags(node, tag)
+    if is_document(node):
+        # <html> is the only child of the document
+        root = node.getroot()
+        if combinator == '>' and (not tag_name or root.tag == tag_name):
+            return iter((root,))
+        return iter(())
+    if combinator == '>':
+        return node.iterchildren(tag)
+    if combinator == '~':
+        return node.itersiblings(tag)
+    # + the next tag sibling
+    el = next(node.itersiblings(etree.Element), None)
+    if el is not None and (not tag_name or el.tag == tag_name):
+        return iter((el,))
+    return iter(())
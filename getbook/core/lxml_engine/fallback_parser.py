@@ -0,0 +1,299 @@
+# coding: utf-8
+
+from ..utils import to_datetime
+from ..parse_lang import parse_lang_by_text
+from ..parse_schema import (
+    parse_ld_title,
+    parse_ld_author,
+    parse_ld_pubdate,
+    parse_ld_publisher,
+    parse_ld_image,
+)
+from ..core_parser import KILL_TAGS, safe_strip
+from ..fallback_parser import GIST_URL, ENTRY_TITLES, LINK_TITLES
+from ..models import Chapter
+from .dom import (
+    Comment, RuleSelector, iter_tags, find, find_by_attribute, first_child,
+    get_text, new_tag, extract, replace_with, to_html,
+)
+from .pre_clean import preclean
+from .parse_content import guess_content
+from .parse_title import guess_title
+from .post_clean import parse_content_and_attachments
+from .parse_meta import (
+    parse_og_title,
+    parse_og_summary,
+    parse_og_image,
+    parse_og_pubdate,
+    parse_ld_json,
+    parse_lang_by_dom,
+)
+from .text_cache import TextCache
+
+
+class FallbackExtractor(object):
+    """Run :class:`~getbook.core.fallback_parser.FallbackParser` on the
+    lxml tree of a parser, it produces the same chapter as the parser.
+
+    Rules and URLs are read from the parser, the parse methods of the
+    parser are not called, they work on BeautifulSoup.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.text_cache = TextCache()
+        self.schema = None
+        self._content = None
+        self._title = None
+
+    @property
+    def dom(self):
+        return self.parser.dom
+
+    def before_parse(self):
+        parser = self.parser
+        if parser.content is None:
+            parser.fetch()
+
+        self.schema = parse_ld_json(self.dom)
+
+        # support for gist
+        for script in list(iter_tags(self.dom, 'script')):
+            src = script.get('src')
+            if src and GIST_URL.search(src):
+                div = self.create_attachment_tag('gist', src[:-3])
+                replace_with(script, div)
+
+    def parse(self):
+        self.before_parse()
+
+        # clean useless tags
+        clean_soup(self.dom)
+
+        # parsing article content
+        content_node = self.parse_content()
+        if content_node is None:
+            raise RuntimeError('No content')
+
+        # parsing article info
+        author = safe_strip(self.parse_author())
+        summary = safe_strip(self.parse_summary())
+        pubdate = self.parse_pubdate()
+        image = self.parse_image()
+        title = safe_strip(self.parse_title())
+
+        # parsing site info
+        lang = self.parse_lang()
+        if not lang and title:
+            lang = parse_lang_by_text(title) or 'en'
+
+        publisher = safe_strip(self.parse_publisher())
+
+        # nodes may be extracted by the parsers above
+        self.text_cache.clear()
+
+        self.make_absolute_links(content_node)
+        content, attachments = parse_content_and_attachments(
+            content_node, self.text_cache
+        )
+        self.text_cache.clear()
+        content = self.parser.clean_content(content)
+
+        if not summary:
+            summary = get_text(content_node)
+
+        if summary:
+            summary = safe_strip(summary)[:120]
+
+        return Chapter(
+            self.parser.url, lang, image, publisher,
+            author, title, summary,
+            content, pubdate, attachments,
+        )
+
+    def create_attachment_tag(self, name, src, **kwargs):
+        attrs = {
+            'class': 'tag tag-{}'.format(name),
+            'data-attachment': name,
+            'data-src': src,
+        }
+        attrs.update(kwargs)
+        node = new_tag('span', attrs)
+        node.text = name
+        return node
+
+    def select_by_rules(self, rules):
+        for els in RuleSelector.compile(rules).select(self.dom):
+            for el in els:
+                yield el
+
+    def make_absolute_links(self, node):
+        valid_sources = ['http', '//', '#']
+
+        def _is_valid(s):
+            for p in valid_sources:
+                if s.startswith(p):
+                    return True
+            return False
+
+        urljoin = self.parser.urljoin
+        for el in iter_tags(node, 'a'):
+            href = el.get('href')
+            if href and not _is_valid(href):
+                el.set('href', urljoin(href))
+
+        for el in iter_tags(node):
+            src = el.get('src')
+            if src:
+                el.set('src', urljoin(src))
+
+    def parse_lang(self):
+        title = self.parse_title()
+        lang = parse_lang_by_text(title) or parse_lang_by_dom(self.dom)
+        return lang or 'en'
+
+    def parse_publisher(self):
+        publisher = parse_ld_publisher(self.schema)
+        if publisher:
+            return publisher
+
+        node = find_by_attribute(self.dom, 'meta', 'property', 'og:site_name')
+        if node is not None:
+            return node.get('content')
+
+    def parse_title(self):
+        title = self._title
+        if title:
+            return title
+
+        title = self.parse_possible_title()
+        self._title = title
+        return title
+
+    def parse_content(self):
+        for node in self.select_by_rules(self.parser.CONTENTS):
+            preclean(node, self.text_cache)
+            self._content = node
+            return node
+
+        preclean(self.dom, self.text_cache)
+        self._content = guess_content(self.dom, self.text_cache)
+        return self._content
+
+    def parse_author(self):
+        author = parse_ld_author(self.schema)
+        if author:
+            return author
+
+        pattern = self.parser.AUTHOR_PATTERN
+        for el in self.select_by_rules(self.parser.AUTHORS):
+            text = to_html(el)
+            if '>' in text:
+                continue
+            text = pattern.sub('', text).strip()
+            if len(text) > 48:
+                continue
+            extract(el)
+            return text
+
+        el = find_by_attribute(self.dom, 'meta', 'name', 'author')
+        if el is not None:
+            return el.get('content')
+
+        # use twitter creator as author name
+        el = find_by_attribute(self.dom, 'meta', 'name', 'twitter:creator')
+        if el is not None:
+            text = el.get('content', '')
+            return text.replace('@', '')
+
+    def parse_pubdate(self):
+        pubdate = parse_ld_pubdate(self.schema) or parse_og_pubdate(self.dom)
+        if pubdate:
+            return pubdate
+
+        for node in self.select_by_rules(self.parser.PUBDATES):
+            date = to_datetime(node.get('datetime'))
+            if date:
+                extract(node)
+                return date
+
+            text = node.get('title') or get_text(node)
+            if text:
+                date = to_datetime(text)
+                if date:
+                    extract(node)
+                    return date
+
+        el = find_by_attribute(self.dom, 'meta', 'name', 'pubdate')
+        if el is not None:
+            return to_datetime(el.get('content'))
+
+    def parse_image(self):
+        return parse_ld_image(self.schema) or parse_og_image(self.dom)
+
+    def parse_summary(self):
+        return parse_og_summary(self.dom)
+
+    def parse_possible_title(self):
+        dom = self.dom
+        url = self.parser.url
+        content = self._content
+        if content is not None:
+            node = first_child(content)
+            if node.tag == 'h1':
+                title = get_text(node)
+                extract(node)
+                return title
+
+        doc = find(dom, 'title')
+        if doc is None:
+            return 'Untitled'
+
+        doctitle = get_text(doc)
+
+        rules = ENTRY_TITLES + LINK_TITLES + tuple(self.parser.OTHER_TITLES)
+        selected = list(RuleSelector.compile(rules).select(dom))
+        link_titles = selected[1:1 + len(LINK_TITLES)]
+        other_titles = selected[1 + len(LINK_TITLES):]
+
+        els = selected[0]
+        if els and len(els) == 1:
+            node = els[0]
+            title = get_text(node)
+            extract(node)
+            return title
+
+        # find absolute link title
+        for els in link_titles:
+            for el in els:
+                href = el.get('href')
+                if href and self.parser.urljoin(href) == url:
+                    extract(el)
+                    return get_text(el)
+
+        possible_titles = []
+        for els in other_titles:
+            possible_titles.extend(els)
+
+        title = guess_title(possible_titles, doctitle, url)
+        if title:
+            return title
+
+        possible_titles = list(iter_tags(dom, 'h2', 'h3', 'h1'))
+        title = guess_title(possible_titles, doctitle, url)
+        if title:
+            return title
+
+        title = parse_ld_title(self.schema) or parse_og_title(dom)
+        if title:
+            return title
+        return doctitle
+
+
+def clean_soup(dom):
+    # clean comments
+    for el in list(dom.iter(Comment)):
+        extract(el)
+
+    for el in list(iter_tags(dom, *KILL_TAGS)):
+        extract(el)
@@ -0,0 +1,109 @@
+# coding: utf-8
+
+from lxml import etree
+
+from ..parse_content import (
+    Candidate,
+    NodeMetrics,
+    create_candidate_chain,
+    find_target,
+    cal_ident_point,
+)
+from .. import config
+from .dom import is_document, iter_tags, get_depth, identities, select
+from .text_cache import TextCache
+
+
+def annotate(root, cache=None):
+    """Calculate the metrics of every tag in one traversal, like
+    :func:`getbook.core.parse_content.annotate`, text lengths are taken
+    from the :class:`TextCache`.
+
+    The returned table maps tags to their :class:`NodeMetrics`.
+    """
+    if cache is None:
+        cache = TextCache()
+    if is_document(root):
+        root = root.getroot()
+
+    table = {}
+    counter = 0
+    metrics = NodeMetrics(0, get_depth(root))
+    stack = [(root, root.iterchildren(etree.Element), metrics)]
+    while stack:
+        node, children, metrics = stack[-1]
+        for child in children:
+            counter += 1
+            child_metrics = NodeMetrics(counter, metrics.depth + 1)
+            stack.append(
+                (child, child.iterchildren(etree.Element), child_metrics))
+            break
+        else:
+            stack.pop()
+            counter += 1
+            metrics.post = counter
+            metrics.text_length = cache.text_length(node)
+            metrics.link_text_length = cache.link_text_length(node)
+            table[node] = metrics
+            if stack:
+                _merge_metrics(stack[-1][2], node, metrics)
+    return table
+
+
+def _merge_metrics(parent, node, metrics):
+    parent.media_count += metrics.media_count
+
+    tag = node.tag
+    if tag == 'p':
+        parent.p_count += 1
+    elif tag in config.source_element_tags:
+        parent.media_count += 1
+
+    if parent.aside_text_length is None:
+        if tag == 'aside':
+            parent.aside_text_length = metrics.text_length
+        else:
+            parent.aside_text_length = metrics.aside_text_length
+
+
+def guess_content(dom, cache=None):
+    candidates = find_candidates(dom, cache)
+    if not candidates:
+        return None
+    chain = create_candidate_chain(candidates)
+    target = find_target(chain)
+    return target[0]
+
+
+def find_candidates(dom, cache=None):
+    tags = list(config.content_container_tags)
+    if len(select(dom, 'body > p')) > 5:
+        tags.append('body')
+
+    candidates = []
+    table = annotate(dom, cache)
+
+    for el in iter_tags(dom, *tags):
+        cand = create_candidate(el, table[el])
+        if cand:
+            candidates.append(cand)
+
+    return candidates
+
+
+def create_candidate(el, metrics):
+    depth = metrics.depth
+    if depth > config.max_depth_of_candidate:
+        return
+
+    if metrics.text_length < config.min_content_length:
+        return
+
+    # <td> tag should not contain <table>
+    # otherwise, it should be layout
+    if metrics.media_count and el.tag == 'td':
+        if not el.text and el[0].tag == 'table':
+            return
+
+    point = cal_ident_point(identities(el), metrics)
+    return Candidate(el, depth, point, metrics)
@@ -0,0 +1,109 @@
+# coding: utf-8
+
+import json
+
+from ..utils import to_datetime
+from ..parse_og import (
+    TITLES, SUMMARIES, PUBDATES,
+    IMAGE_SOURCES, IMAGE_WIDTHS, IMAGE_HEIGHTS, IGNORE_IMAGES,
+)
+from ..parse_schema import ARTICLE_TYPES
+from .dom import iter_tags, find, find_by_attribute, get_text
+
+
+def get_meta_content(dom, attrs):
+    for pair in attrs:
+        for key in pair:
+            el = find_by_attribute(dom, 'meta', key, pair[key])
+            if el is not None:
+                return el.get('content')
+
+
+def parse_og_title(dom):
+    return get_meta_content(dom, TITLES)
+
+
+def parse_og_summary(dom):
+    return get_meta_content(dom, SUMMARIES)
+
+
+def parse_og_pubdate(dom):
+    return to_datetime(get_meta_content(dom, PUBDATES))
+
+
+def parse_og_image(dom):
+    src = get_meta_content(dom, IMAGE_SOURCES)
+    if not src:
+        return None
+
+    if not src.startswith('http'):
+        return None
+
+    for key in IGNORE_IMAGES:
+        if key in src:
+            return None
+
+    rv = {'src': src}
+
+    width = get_meta_content(dom, IMAGE_WIDTHS)
+    if width:
+        rv['width'] = width
+
+    height = get_meta_content(dom, IMAGE_HEIGHTS)
+    if height:
+        rv['height'] = height
+    return rv
+
+
+def parse_ld_json(dom):
+    els = [
+        el for el in iter_tags(dom, 'script')
+        if el.get('type') == 'application/ld+json'
+    ]
+    if not els:
+        return None
+
+    schemas = []
+    for el in els:
+        text = get_text(el)
+        start = text.find('{')
+        end = text.rfind('}') + 1
+        try:
+            schema = json.loads(text[start:end])
+            if schema.get('@type') in ARTICLE_TYPES:
+                schemas.append(schema)
+        except json.JSONDecodeError:
+            pass
+
+    if len(schemas) == 1:
+        return schemas[0]
+
+
+def parse_lang_by_dom(dom):
+    node = find(dom, 'html')
+    if node is None:
+        return None
+
+    lang = node.get('lang') or node.get('xml:lang')
+    if lang:
+        return lang.split('-')[0]
+
+    for el in iter_tags(node, 'meta'):
+        equiv = el.get('http-equiv')
+        if equiv and equiv.lower() == 'content-language':
+            lang = el.get('content')
+            if not lang:
+                return None
+            # <meta http-equiv="Content-Language" content="de, fr, it">
+            lang = lang.split(',')[0]
+            return lang.split('-')[0]
+
+    return None
+
+
+def get_canonical_link(dom):
+    el = find_by_attribute(dom, 'link', 'rel', 'canonical')
+    if el is not None:
+        href = el.get('href')
+        if href and href.startswith('http'):
+            return href
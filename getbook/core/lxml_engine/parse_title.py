@@ -0,0 +1,83 @@
+# coding: utf-8
+
+from ..parse_title import (
+    SPLIT_PATTERN,
+    guess_from_doctitles,
+    same_link,
+    is_similar,
+    levenshtein,
+)
+from .dom import iter_tags, find, get_text, get_depth, identities, extract
+
+
+def guess_title(candidates, doctitle, url):
+    cache = []
+    doctitles = SPLIT_PATTERN.split(doctitle)
+    for node in candidates:
+        if node.tag == 'a':
+            title = guess_from_a_tag(node, doctitle, url)
+            if title:
+                return title
+        else:
+            link_node = find(node, 'a')
+            if link_node is not None:
+                title = guess_from_a_tag(link_node, doctitle, url)
+                if title:
+                    return title
+                continue
+
+        guess = guess_from_doctitles(get_text(node), doctitles)
+        if guess:
+            right = sorted(guess, key=lambda o: o[0], reverse=True)[0]
+            point = 0.3
+            if node.tag not in ('header', 'h1', 'h2', 'h3', 'a'):
+                point = 0.5
+
+            ident = ''.join(identities(node))
+            if right[0] > point and 'title' in ident:
+                extract(node)
+                return right[1]
+
+            if right[0] > point:
+                cache.append((node, right[0], right[1]))
+
+    if not cache:
+        return None
+
+    cache = sorted(
+        cache,
+        key=lambda o: get_depth(o[0]) * o[1],
+        reverse=True
+    )
+    node = cache[0][0]
+    title = get_text(node)
+    for span in list(iter_tags(node, 'span')):
+        extract(span)
+
+    title = get_text(node) or title
+    if not title:
+        return None
+
+    extract(node)
+    for t in doctitles:
+        if 1 - levenshtein(t, title) / float(len(title)) > 0.9:
+            return t.strip()
+    return title.strip()
+
+
+def guess_from_a_tag(node, doctitle, url):
+    alt_title = get_text(node)
+    title = node.get('title') or alt_title
+    # people using img as title
+    img = find(node, 'img')
+    if img is not None and img.get('alt'):
+        title = img.get('alt')
+
+    href = node.get('href')
+    if same_link(href, url) and len(title) <= len(doctitle)\
+       and is_similar(title, doctitle):
+        extract(node)
+        if alt_title in title:
+            # title has other description
+            return alt_title
+        return title
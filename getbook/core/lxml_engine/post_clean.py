@@ -0,0 +1,223 @@
+# coding: utf-8
+
+import json
+from collections import defaultdict
+
+from ..utils import match_specific_symbols
+from ..post_clean import CJK_NEWLINE, transform_newlines
+from .. import config
+from .dom import (
+    iter_tags, find, find_by_attribute, find_all_next, select,
+    get_text, get_classes, identities, new_tag, to_html, inner_html,
+)
+from .text_cache import TextCache
+
+
+def parse_content_and_attachments(node, cache=None):
+    attachments = parse_attachments(node, cache)
+    content = normalize_html(node)
+    return content, attachments
+
+
+def parse_attachments(node, cache=None):
+    if cache is None:
+        cache = TextCache()
+
+    attachments = defaultdict(list)
+
+    for el in list(iter_tags(node, *config.source_element_tags)):
+        tag = el.tag
+        data = parse_attachment(el, cache)
+        if data:
+            attachments[tag].append(data)
+
+    for el in select(node, '[data-attachment]'):
+        data = parse_attachment_tag(el)
+        if data:
+            tag = el.get('data-attachment')
+            attachments[tag].append(data)
+
+    for el in list(iter_tags(node)):
+        clean_node(el, cache)
+
+    return attachments
+
+
+def parse_attachment_tag(node):
+    tag = node.get('data-attachment')
+    data = {'tag': tag}
+    for k in node.attrib:
+        if k.startswith('data-'):
+            data[k.replace('data-', '')] = node.get(k)
+    return data
+
+
+def parse_attachment(node, cache=None):
+    tag = node.tag
+    attrs = config.elements_keep_attributes[tag]
+    data = {k: node.get(k) for k in attrs if node.get(k)}
+
+    data['tag'] = tag
+
+    if tag in ('audio', 'video'):
+        sources = _get_child_attchments(node, 'source')
+        if sources:
+            data['sources'] = sources
+        tracks = _get_child_attchments(node, 'track')
+        if tracks:
+            data['tracks'] = tracks
+    elif tag == 'object':
+        params = _get_child_attchments(node, 'param')
+        if params:
+            data['params'] = params
+
+    if cache is None:
+        cache = TextCache()
+
+    if tag in config.source_element_tags:
+        if not data.get('src') and not data.get('sources'):
+            cache.extract(node)
+            return None
+
+    src = data.get('src')
+    if src and src.startswith('//'):
+        data['src'] = 'http:' + src
+
+    # replace source_element_tags
+    span = new_tag('span', {
+        'class': 'tag tag-' + tag,
+        'data-attrs': json.dumps(data),
+    })
+    span.text = tag
+    cache.replace_with(node, span)
+    return data
+
+
+def normalize_html(node):
+    if node is None:
+        return ''
+
+    if node.tag in config.content_container_tags:
+        html = inner_html(node)
+    else:
+        html = to_html(node)
+
+    html = CJK_NEWLINE.sub(r'\1\2', html)
+    return transform_newlines(html)
+
+
+def clean_node(node, cache):
+    if is_blank_element(node):
+        cache.extract(node)
+        return
+
+    if is_ignored_elements(node, cache):
+        cache.extract(node)
+        return
+
+    if node.tag == 'table':
+        table_codeblock(node, cache)
+    elif node.tag == 'a':
+        href = node.get('href', '')
+        if href == '#' or href.lower().startswith('javascript:'):
+            # it is not a link any more
+            cache.invalidate(node)
+            node.tag = 'span'
+
+    unwrap_useless_tag(node, cache)
+    clean_mess(node)
+    return node
+
+
+def is_blank_element(node):
+    if node.tag in config.self_closing_tags:
+        return False
+
+    if node.tag in ['td', 'th']:
+        return False
+
+    if find(node, *config.self_closing_tags) is not None:
+        return False
+
+    if get_text(node):
+        return False
+
+    return find_by_attribute(node, None, 'src') is None
+
+
+def is_ignored_elements(node, cache):
+    ident = identities(node)
+
+    if match_specific_symbols(ident, config.ignored_bottom_symbols):
+        for item in find_all_next(node):
+            cache.extract(item)
+        return True
+
+    if match_specific_symbols(ident, config.ignored_meta_symbols):
+        return True
+
+    if not match_specific_symbols(ident, config.negative_symbols):
+        return False
+
+    return cache.text_length(node) < config.min_negative_text_length
+
+
+def unwrap_useless_tag(node, cache):
+    tag = node.tag
+    if tag in config.useless_tags:
+        return cache.unwrap(node)
+
+    # unwrap useless span
+    if tag == 'span':
+        if get_classes(node):
+            return
+
+        p = node.getparent()
+        # clean span in paragraph
+        if p is not None and p.tag == 'p':
+            return cache.unwrap(node)
+
+
+def clean_mess(node):
+    tag = node.tag
+    classes = get_classes(node)
+    if tag == 'span' and classes:
+        if 'tag' in classes:
+            return
+
+        p = node.getparent()
+        if p is not None and p.tag in ['pre', 'code']:
+            return
+
+    keep_attributes = config.elements_keep_attributes.get(tag, [])
+    attrs = list(node.attrib.keys())
+
+    for attr in attrs:
+        if attr in config.keep_attributes:
+            continue
+        if attr not in keep_attributes:
+            del node.attrib[attr]
+
+
+def table_codeblock(node, cache):
+    tds = list(iter_tags(node, 'td'))
+    if len(tds) != 2:
+        return
+    line_td = tds[0]
+    text = get_text(line_td, strip=True)
+    if not text.startswith('123'):
+        return
+    code = tds[1]
+    code.tag = 'pre'
+    cache.replace_with(node, code)
+    return code
+
+
+def _get_child_attchments(node, tag):
+    els = list(iter_tags(node, tag))
+    if els:
+        data = []
+        attrs = config.elements_keep_attributes[tag]
+        for el in els:
+            data.append({k: el.get(k) for k in attrs if el.get(k)})
+        return data
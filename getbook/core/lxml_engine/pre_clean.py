@@ -0,0 +1,198 @@
+# coding: utf-8
+
+import re
+
+from ..utils import pure_text, match_specific_symbols
+from ..pre_clean import h_tag, clean_media, clean_link, _get_lazy_img_src
+from .. import config
+from .dom import iter_tags, find, get_text, identities
+from .text_cache import TextCache
+
+
+def preclean(node, cache=None):
+    if cache is None:
+        cache = TextCache()
+    for el in list(iter_tags(node)):
+        clean_node(el, cache)
+
+
+def clean_node(node, cache):
+    clean_ignored(node, cache)
+
+    tag = node.tag
+    if tag in config.block_element_tags:
+        return clean_block(node, cache)
+
+    if tag in config.media_element_tags:
+        clean_media(node, cache)
+        return
+
+    if tag == 'picture':
+        clean_picture(node, cache)
+        return
+
+    if tag == 'a':
+        clean_link(node, cache)
+        return
+
+    if tag == 'img':
+        clean_image(node, cache)
+        return
+
+    if tag == 'span':
+        return clean_span(node, cache)
+
+    if tag == 'wbr':
+        cache.unwrap(node)
+        return
+
+    return node
+
+
+def clean_ignored(node, cache):
+    # related articles after content
+    tag = node.tag
+    if tag in ['p', 'div', 'ul', 'ol'] or h_tag.search(tag):
+        if _is_related_after(node, cache):
+            return cache.extract(node)
+
+    ident = identities(node)
+    # when there are too many class, be careful
+    if len(ident) > 5:
+        return
+
+    for key in ident:
+        for symbol in config.force_keep_symbols:
+            if symbol in key:
+                return
+
+        for symbol in config.ignored_symbols:
+            if symbol in key:
+                return cache.extract(node)
+
+        for symbol in config.ignored_prefix_symbols:
+            if key.startswith(symbol):
+                return cache.extract(node)
+
+        for symbol in config.ignored_suffix_symbols:
+            if key.endswith(symbol):
+                return cache.extract(node)
+
+        for symbol in config.ignored_in_content:
+            if symbol in key:
+                return cache.extract(node)
+
+    text_length = cache.text_length(node)
+    link_text_length = cache.link_text_length(node)
+    if text_length - link_text_length > config.min_negative_text_length:
+        return
+
+    if match_specific_symbols(ident, config.negative_symbols):
+        return cache.extract(node)
+
+
+def clean_block(node, cache):
+    style = node.get('style')
+    if style and re.search(r'display:\s*none', style):
+        cache.extract(node)
+        return
+
+    ident = identities(node)
+    if match_specific_symbols(ident, ['title']):
+        return node
+
+    link_text_length = cache.link_text_length(node)
+    text_length = cache.text_length(node)
+    images = list(iter_tags(node, *config.media_element_tags))
+    if images:
+        if node.tag == 'table' and not text_length and len(images) == 1:
+            node = cache.replace_with(node, images[0])
+
+        delta = text_length - link_text_length
+        if delta > 20 * len(images):
+            return
+
+        for img in images:
+            _load_lazy_img(img)
+
+        return node
+
+    # less than 2 links is not rubbish content
+    links = list(iter_tags(node, 'a'))
+    if len(links) < 2:
+        return node
+
+    if text_length - link_text_length > config.min_length_of_paragraph:
+        return node
+
+    # it may contain title
+    if find(node, 'h1', 'h2') is not None:
+        return node
+
+    if node.tag in ['ul', 'ol']:
+        ident = identities(node)
+        li = find(node, 'li')
+        if li is not None:
+            ident.extend(identities(li))
+
+        if not ident:
+            return node
+
+    cache.extract(node)
+
+
+def clean_picture(node, cache):
+    img = find(node, 'img')
+    if img is not None:
+        clean_image(img, cache)
+        cache.replace_with(node, img)
+
+
+def clean_span(node, cache):
+    ident = identities(node)
+    for c in ident:
+        if '-' in c:
+            return node
+        if len(c) > config.max_length_of_class:
+            cache.extract(node)
+            return
+
+
+def clean_image(node, cache):
+    _load_lazy_img(node)
+    src = node.get('src')
+
+    if not src:
+        srcset = node.get('srcset')
+
+        if srcset:
+            src = srcset.split(' ')[0]
+            node.set('src', src)
+
+    if not src or src.startswith('data:'):
+        cache.extract(node)
+
+
+def _is_related_after(node, cache):
+    if cache.text_length(node) > 20:
+        return False
+
+    text = pure_text(get_text(node)).lower()
+    if len(text) > 20:
+        return False
+
+    for word in config.related_content_text:
+        if word in text:
+            return len(text) / len(word) < 3
+
+    return False
+
+
+def _load_lazy_img(node):
+    src = _get_lazy_img_src(node)
+    if not src:
+        parent = node.getparent()
+        if parent is not None:
+            src = _get_lazy_img_src(parent)
+    if src:
+        node.set('src', src)
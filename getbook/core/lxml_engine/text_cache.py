@@ -0,0 +1,92 @@
+# coding: utf-8
+
+from ..utils import pure_text
+from .dom import is_tag, is_document, extract, unwrap, replace_with
+
+
+class TextCache(object):
+    """The :class:`~getbook.core.text_cache.TextCache` of lxml elements.
+
+    The text of an element and the tails of its children are its strings,
+    comments are not a part of the text. Elements are the keys of the
+    cache, keeping them alive keeps their proxies the same objects.
+    """
+
+    def __init__(self):
+        # element => (text length, link text length)
+        self._items = {}
+
+    def text_length(self, node):
+        return self._get(node)[0]
+
+    def link_text_length(self, node):
+        """Length of pure_text of every <a> in node, the nested ones are
+        counted twice."""
+        return self._get(node)[1]
+
+    def extract(self, node):
+        self.invalidate(node)
+        return extract(node)
+
+    def unwrap(self, node):
+        self.invalidate(node)
+        self._items.pop(node, None)
+        return unwrap(node)
+
+    def replace_with(self, node, new):
+        self.invalidate(node)
+        self.invalidate(new)
+        return replace_with(node, new)
+
+    def invalidate(self, node):
+        """Forget the ancestors of node, call it before node is moved,
+        removed or renamed."""
+        for parent in node.iterancestors():
+            self._items.pop(parent, None)
+
+    def clear(self):
+        self._items = {}
+
+    def _get(self, node):
+        if is_document(node):
+            node = node.getroot()
+
+        item = self._items.get(node)
+        if item is not None:
+            return item
+
+        # sum the lengths bottom-up, with a stack instead of recursion,
+        # documents may be deeply nested
+        stack = [(node, node.iterchildren(), [_length(node.text), 0])]
+        while stack:
+            el, children, sums = stack[-1]
+            for child in children:
+                sums[0] += _length(child.tail)
+                if not is_tag(child):
+                    continue
+                item = self._items.get(child)
+                if item is None:
+                    sums = [_length(child.text), 0]
+                    stack.append((child, child.iterchildren(), sums))
+                    break
+                _add_lengths(sums, child, item)
+            else:
+                stack.pop()
+                item = (sums[0], sums[1])
+                self._items[el] = item
+                if stack:
+                    _add_lengths(stack[-1][2], el, item)
+        return item
+
+
+def _length(text):
+    if not text:
+        return 0
+    return len(pure_text(text))
+
+
+def _add_lengths(sums, node, item):
+    sums[0] += item[0]
+    sums[1] += item[1]
+    if node.tag == 'a':
+        sums[1] += item[0]
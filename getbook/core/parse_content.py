@@ -1,12 +1,97 @@
 # coding: utf-8
 
 import math
-from .utils import pure_text, identities, get_depth
+from collections import namedtuple
+from bs4.element import Tag
+from .utils import identities, get_depth
+from .text_cache import TextCache
 from . import config
 
-
-def guess_content(dom):
-    candidates = find_candidates(dom)
+# a tag that may be the content, node, depth and point are used as
+# cand[0], cand[1] and cand[2] too
+Candidate = namedtuple('Candidate', ['node', 'depth', 'point', 'metrics'])
+
+
+class NodeMetrics(object):
+    """Numbers of a node needed for scoring, see :func:`annotate`."""
+
+    __slots__ = (
+        'pre', 'post', 'depth', 'text_length', 'link_text_length',
+        'p_count', 'media_count', 'aside_text_length',
+    )
+
+    def __init__(self, pre, depth):
+        # numbers of the node in pre-order and post-order, a node is an
+        # ancestor of another one when its interval contains the other
+        self.pre = pre
+        self.post = None
+        self.depth = depth
+        # length of pure_text(node)
+        self.text_length = 0
+        # length of pure_text of every <a> in node, nested ones included
+        self.link_text_length = 0
+        # count of direct <p> children
+        self.p_count = 0
+        # count of config.source_element_tags in node
+        self.media_count = 0
+        # length of pure_text of the first <aside> in node
+        self.aside_text_length = None
+
+
+def annotate(root, cache=None):
+    """Calculate the metrics of every tag in one bottom-up traversal.
+
+    The returned table maps ``id(tag)`` to its :class:`NodeMetrics`, it
+    is only valid while the tree is not changed. Lengths of strings are
+    taken from the :class:`TextCache`.
+    """
+    if cache is None:
+        cache = TextCache()
+
+    table = {}
+    counter = 0
+    stack = [(root, iter(root.contents), NodeMetrics(0, get_depth(root)))]
+    while stack:
+        node, children, metrics = stack[-1]
+        for child in children:
+            if isinstance(child, Tag):
+                counter += 1
+                child_metrics = NodeMetrics(counter, metrics.depth + 1)
+                stack.append((child, iter(child.contents), child_metrics))
+                break
+            metrics.text_length += cache.text_length(child)
+        else:
+            stack.pop()
+            counter += 1
+            metrics.post = counter
+            table[id(node)] = metrics
+            if stack:
+                _merge_metrics(stack[-1][2], node, metrics)
+    return table
+
+
+def _merge_metrics(parent, node, metrics):
+    parent.text_length += metrics.text_length
+    parent.link_text_length += metrics.link_text_length
+    parent.media_count += metrics.media_count
+
+    name = node.name
+    if name == 'a':
+        parent.link_text_length += metrics.text_length
+    elif name == 'p':
+        parent.p_count += 1
+    elif name in config.source_element_tags:
+        parent.media_count += 1
+
+    if parent.aside_text_length is None:
+        if name == 'aside':
+            parent.aside_text_length = metrics.text_length
+        else:
+            parent.aside_text_length = metrics.aside_text_length
+
+
+def guess_content(dom, cache=None):
+    candidates = find_candidates(dom, cache)
     if not candidates:
         return None
     chain = create_candidate_chain(candidates)
@@ -14,45 +99,45 @@ def guess_content(dom):
     return target[0]
 
 
-def find_candidates(dom):
+def find_candidates(dom, cache=None):
     tags = list(config.content_container_tags)
     if len(dom.select('body > p')) > 5:
         tags.append('body')
 
     candidates = []
+    table = annotate(dom, cache)
 
     for el in dom.find_all(tags):
-        cand = create_candidate(el)
+        cand = create_candidate(el, table[id(el)])
         if cand:
             candidates.append(cand)
 
     return candidates
 
 
-def create_candidate(el):
-    depth = get_depth(el)
+def create_candidate(el, metrics):
+    depth = metrics.depth
     if depth > config.max_depth_of_candidate:
         return
 
-    if len(pure_text(el)) < config.min_content_length:
+    if metrics.text_length < config.min_content_length:
         return
 
-    is_possible = el.find_all(config.source_element_tags)
     # <td> tag should not contain <table>
     # otherwise, it should be layout
-    if is_possible and el.name == 'td':
+    if metrics.media_count and el.name == 'td':
         tag = getattr(el.contents[0], 'name', None)
         if tag and tag == 'table':
             return
 
-    point = cal_point(el, depth)
-    return el, depth, point
+    point = cal_point(el, metrics)
+    return Candidate(el, depth, point, metrics)
 
 
 def create_candidate_chain(candidates):
-    top = sorted(candidates, key=lambda o: o[2], reverse=True)[0]
-    min_point = max(math.sqrt(top[2]), top[2] / 4)
-    candidates.sort(key=lambda o: o[1])
+    top = max(candidates, key=lambda o: o.point)
+    min_point = max(math.sqrt(top.point), top.point / 4)
+    candidates.sort(key=lambda o: o.depth)
 
     chain = []
     children = []
@@ -60,9 +145,9 @@ def create_candidate_chain(candidates):
     for cand in candidates:
         if cand[2] < min_point:
             continue
-        if is_parent(cand[0], top[0]):
+        if is_parent(cand, top):
             chain.append(cand)
-        elif is_parent(top[0], cand[0]):
+        elif is_parent(top, cand):
             if children:
                 latest = children[-1]
                 if latest[1] == cand[1]:
@@ -71,7 +156,7 @@ def create_candidate_chain(candidates):
                         continue
                     children.pop()
                     children.append(cand)
-                elif is_parent(latest[0], cand[0]):
+                elif is_parent(latest, cand):
                     children.append(cand)
             else:
                 children.append(cand)
@@ -98,7 +183,7 @@ def find_target(chain):
     if not targets:
         return last_item
 
-    target = sorted(targets, key=lambda o: o[0], reverse=True)[0]
+    target = max(targets, key=lambda o: o[0])
     current = target[1]
 
     # it maybe the last one
@@ -110,19 +195,23 @@ def find_target(chain):
 
 
 def is_parent(parent, child):
-    count = 0
-    while count < 5 and child is not None:
-        p = child.parent
-        if p == parent:
-            return True
-        child = p
-        count += 1
+    """Check if the parent candidate is one of the closest 5 ancestors
+    of the child candidate."""
+    a = parent.metrics
+    b = child.metrics
+    if a.pre < b.pre and b.post < a.post:
+        return b.depth - a.depth <= 5
     return False
 
 
-def cal_point(el, depth):
+def cal_point(el, metrics):
+    return cal_ident_point(identities(el), metrics)
+
+
+def cal_ident_point(ident, metrics):
+    depth = metrics.depth
     mul = depth
-    idc = ' '.join(identities(el))
+    idc = ' '.join(ident)
     for word in config.positive_symbols:
         if word in idc:
             mul += 0.6
@@ -134,16 +223,13 @@ def cal_point(el, depth):
             break
 
     # plus paragraph point
-    p_count = len(el.select('> p'))
-    if p_count:
+    if metrics.p_count:
         mul += math.sqrt(depth) / 5
 
-    link_text = ''.join([pure_text(a) for a in el.find_all('a')])
-    valid_text_length = len(pure_text(el)) - len(link_text)
+    valid_text_length = metrics.text_length - metrics.link_text_length
 
-    aside = el.find('aside')
-    if aside:
-        valid_text_length -= len(pure_text(aside)) / 2
+    if metrics.aside_text_length is not None:
+        valid_text_length -= metrics.aside_text_length / 2
 
     point = valid_text_length / config.min_length_of_paragraph
     return mul * point
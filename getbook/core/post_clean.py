@@ -4,24 +4,28 @@ import json
 import re
 from collections import defaultdict
 
-from .utils import pure_text, identities, match_specific_symbols
+from .utils import identities, match_specific_symbols
+from .text_cache import TextCache
 from . import config
 
 CJK_NEWLINE = re.compile(r'([\u4e00-\u9fff]+?)\n([\u4e00-\u9fff+?])')
 MANY_BR = re.compile(r'(<br\s*/?>\s*\n*){3,}')
 
 
-def parse_content_and_attachments(node, soup):
-    attachments = parse_attachments(node, soup)
+def parse_content_and_attachments(node, soup, cache=None):
+    attachments = parse_attachments(node, soup, cache)
     content = normalize_html(node)
     return content, attachments
 
 
-def parse_attachments(node, soup):
+def parse_attachments(node, soup, cache=None):
+    if cache is None:
+        cache = TextCache()
+
     attachments = defaultdict(list)
 
     for el in node.find_all(config.source_element_tags):
-        data = parse_attachment(el, soup)
+        data = parse_attachment(el, soup, cache)
         if data:
             attachments[el.name].append(data)
 
@@ -32,12 +36,12 @@ def parse_attachments(node, soup):
             attachments[tag].append(data)
 
     for el in node.find_all(True):
-        clean_node(el)
+        clean_node(el, cache)
 
     return attachments
 
 
-def parse_attachment(node, soup=None):
+def parse_attachment(node, soup=None, cache=None):
     if soup is None:
         tag = node.get('data-attachment')
         data = {'tag': tag}
@@ -64,9 +68,12 @@ def parse_attachment(node, soup=None):
         if params:
             data['params'] = params
 
+    if cache is None:
+        cache = TextCache()
+
     if tag in config.source_element_tags:
         if not data.get('src') and not data.get('sources'):
-            node.extract()
+            cache.extract(node)
             return None
 
     src = data.get('src')
@@ -78,7 +85,7 @@ def parse_attachment(node, soup=None):
     span['class'] = 'tag tag-' + tag
     span['data-attrs'] = json.dumps(data)
     span.string = tag
-    node.replace_with(span)
+    cache.replace_with(node, span)
     return data
 
 
@@ -97,24 +104,26 @@ def normalize_html(node):
     return transform_newlines(html)
 
 
-def clean_node(node):
+def clean_node(node, cache):
     if is_blank_element(node):
-        node.extract()
+        cache.extract(node)
         return
 
-    if is_ignored_elements(node):
-        node.extract()
+    if is_ignored_elements(node, cache):
+        cache.extract(node)
         return
 
     if node.name == 'table':
-        table_codeblock(node)
+        table_codeblock(node, cache)
     elif node.name == 'a':
         href = node.get('href', '')
         if href == '#' or href.lower().startswith('javascript:'):
+            # it is not a link any more
+            cache.invalidate(node)
             node.name = 'span'
 
     if node:
-        unwrap_useless_tag(node)
+        unwrap_useless_tag(node, cache)
 
     if node:
         clean_mess(node)
@@ -137,12 +146,12 @@ def is_blank_element(node):
     return not node.find(src=True)
 
 
-def is_ignored_elements(node):
+def is_ignored_elements(node, cache):
     ident = identities(node)
 
     if match_specific_symbols(ident, config.ignored_bottom_symbols):
         for item in node.find_all_next(True):
-            item.extract()
+            cache.extract(item)
         return True
 
     if match_specific_symbols(ident, config.ignored_meta_symbols):
@@ -151,13 +160,13 @@ def is_ignored_elements(node):
     if not match_specific_symbols(ident, config.negative_symbols):
         return False
 
-    return len(pure_text(node)) < config.min_negative_text_length
+    return cache.text_length(node) < config.min_negative_text_length
 
 
-def unwrap_useless_tag(node):
+def unwrap_useless_tag(node, cache):
     tag = getattr(node, 'name', None)
     if tag and tag in config.useless_tags:
-        return node.unwrap()
+        return cache.unwrap(node)
 
     # unwrap useless span
     if tag == 'span':
@@ -167,7 +176,7 @@ def unwrap_useless_tag(node):
         p = node.parent
         # clean span in paragraph
         if p and p.name == 'p':
-            return node.unwrap()
+            return cache.unwrap(node)
 
 
 def clean_mess(node):
@@ -193,7 +202,7 @@ def clean_mess(node):
             del node.attrs[attr]
 
 
-def table_codeblock(node):
+def table_codeblock(node, cache):
     tds = node.find_all('td')
     if len(tds) != 2:
         return
@@ -203,7 +212,7 @@ def table_codeblock(node):
         return
     code = tds[1]
     code.name = 'pre'
-    node.replace_with(code)
+    cache.replace_with(node, code)
     return code
 
 
@@ -3,59 +3,62 @@
 import re
 
 from .utils import pure_text, identities, match_specific_symbols
+from .text_cache import TextCache
 from . import config
 
 h_tag = re.compile(r'^h\d$')
 
 
-def preclean(node):
+def preclean(node, cache=None):
+    if cache is None:
+        cache = TextCache()
     for el in node.find_all(True):
-        clean_node(el)
+        clean_node(el, cache)
 
 
-def clean_node(node):
-    clean_ignored(node)
+def clean_node(node, cache):
+    clean_ignored(node, cache)
     if not node:
         return
 
     if node.name in config.block_element_tags:
-        return clean_block(node)
+        return clean_block(node, cache)
 
     if node.name in config.media_element_tags:
-        clean_media(node)
+        clean_media(node, cache)
         return
 
     if node.name == 'picture':
-        clean_picture(node)
+        clean_picture(node, cache)
         return
 
     if node.name == 'a':
-        clean_link(node)
+        clean_link(node, cache)
         return
 
     if node.name == 'img':
-        clean_image(node)
+        clean_image(node, cache)
         return
 
     if node.name == 'span':
-        return clean_span(node)
+        return clean_span(node, cache)
 
     if node.name == 'wbr':
-        node.unwrap()
+        cache.unwrap(node)
         return
 
     return node
 
 
-def clean_ignored(node):
+def clean_ignored(node, cache):
     # related articles after content
     tag = getattr(node, 'name', None)
     if not tag:
         return
 
     if tag in ['p', 'div', 'ul', 'ol'] or h_tag.search(tag):
-        if _is_related_after(node):
-            return node.extract()
+        if _is_related_after(node, cache):
+            return cache.extract(node)
 
     ident = identities(node)
     # when there are too many class, be careful
@@ -69,47 +72,45 @@ def clean_ignored(node):
 
         for symbol in config.ignored_symbols:
             if symbol in key:
-                return node.extract()
+                return cache.extract(node)
 
         for symbol in config.ignored_prefix_symbols:
             if key.startswith(symbol):
-                return node.extract()
+                return cache.extract(node)
 
         for symbol in config.ignored_suffix_symbols:
             if key.endswith(symbol):
-                return node.extract()
+                return cache.extract(node)
 
         for symbol in config.ignored_in_content:
             if symbol in key:
-                return node.extract()
+                return cache.extract(node)
 
-    links = node.find_all('a')
-    link_text = ''.join([pure_text(a) for a in links])
-    if len(pure_text(node)) - len(link_text) > config.min_negative_text_length:
+    text_length = cache.text_length(node)
+    link_text_length = cache.link_text_length(node)
+    if text_length - link_text_length > config.min_negative_text_length:
         return
 
     if match_specific_symbols(ident, config.negative_symbols):
-        return node.extract()
+        return cache.extract(node)
 
 
-def clean_block(node):
+def clean_block(node, cache):
     style = node.get('style')
     if style and re.search(r'display:\s*none', style):
-        node.extract()
+        cache.extract(node)
         return
 
     ident = identities(node)
     if match_specific_symbols(ident, ['title']):
         return node
 
-    links = node.find_all('a')
-    link_text = ''.join([pure_text(a) for a in links])
-    link_text_length = len(link_text)
-    text_length = len(pure_text(node))
+    link_text_length = cache.link_text_length(node)
+    text_length = cache.text_length(node)
     images = node.find_all(config.media_element_tags)
     if images:
         if node.name == 'table' and not text_length and len(images) == 1:
-            node = node.replace_with(images[0])
+            node = cache.replace_with(node, images[0])
 
         delta = text_length - link_text_length
         if delta > 20 * len(images):
@@ -121,6 +122,7 @@ def clean_block(node):
         return node
 
     # less than 2 links is not rubbish content
+    links = node.find_all('a')
     if len(links) < 2:
         return node
 
@@ -140,48 +142,48 @@ def clean_block(node):
         if not ident:
             return node
 
-    node.extract()
+    cache.extract(node)
 
 
-def clean_picture(node):
+def clean_picture(node, cache):
     img = node.find('img')
     if img:
-        clean_image(img)
+        clean_image(img, cache)
     if img:
-        node.replace_with(img)
+        cache.replace_with(node, img)
 
 
-def clean_span(node):
+def clean_span(node, cache):
     ident = identities(node)
     for c in ident:
         if '-' in c:
             return node
         if len(c) > config.max_length_of_class:
-            node.extract()
+            cache.extract(node)
             return
 
 
-def clean_media(node):
+def clean_media(node, cache):
     src = node.get('src')
     if not src:
-        return node.extract()
+        return cache.extract(node)
 
     for key in config.positive_sources:
         if key in src:
             return False
 
-    node.extract()
+    cache.extract(node)
 
 
-def clean_link(node):
+def clean_link(node, cache):
     src = node.get('href', '')
 
     for key in config.negative_sources:
         if key in src:
-            return node.extract()
+            return cache.extract(node)
 
 
-def clean_image(node):
+def clean_image(node, cache):
     _load_lazy_img(node)
     src = node.get('src')
 
@@ -193,10 +195,13 @@ def clean_image(node):
             node['src'] = src
 
     if not src or src.startswith('data:'):
-        node.extract()
+        cache.extract(node)
 
 
-def _is_related_after(node):
+def _is_related_after(node, cache):
+    if cache.text_length(node) > 20:
+        return False
+
     text = pure_text(node).lower()
     if len(text) > 20:
         return False
@@ -0,0 +1,291 @@
+# coding: utf-8
+
+import re
+import shlex
+from bs4.element import Tag
+
+COMBINATORS = ('>', '+', '~')
+TAG_NAME = re.compile(r'^[a-zA-Z0-9][-.a-zA-Z0-9:_]*$')
+ATTRIBUTE_SELECTOR = re.compile(
+    r'^(?P<tag>[a-zA-Z0-9][-.a-zA-Z0-9:_]*)?\[(?P<attribute>[\w-]+)'
+    r'(?P<operator>[=~\|\^\$\*]?)=?"?(?P<value>[^\]"]*)"?\]$'
+)
+QUOTED_COLON = re.compile(r'"[^"]*:[^"]*"')
+
+# compiled RuleSelectors, by class and rules
+_rule_selectors = {}
+
+
+def compile_token(token, get_attribute):
+    """Compile a selector without combinators, e.g. ``a[rel=author]``,
+    into its tag name and a checker of the rest, the same way as
+    ``Tag.select`` of BeautifulSoup 4.6. ``get_attribute(el, key)``
+    returns a list for multi-valued attributes."""
+    m = ATTRIBUTE_SELECTOR.match(token)
+    if m is not None:
+        tag_name, attribute, operator, value = m.groups()
+        checker = attribute_checker(operator, attribute, value, get_attribute)
+        return tag_name, checker
+
+    if '#' in token:
+        tag_name, tag_id = token.split('#', 1)
+        return tag_name, lambda el: get_attribute(el, 'id') == tag_id
+
+    if '.' in token:
+        tag_name, klass = token.split('.', 1)
+        classes = set(klass.split('.'))
+
+        def classes_match(el):
+            return classes.issubset(get_attribute(el, 'class') or [])
+        return tag_name, classes_match
+
+    if ':' in token and not QUOTED_COLON.search(token):
+        raise NotImplementedError(
+            'Pseudo-classes are not supported: "%s"' % token)
+
+    if token == '*':
+        return None, None
+
+    if TAG_NAME.match(token):
+        return token, None
+
+    raise ValueError('Unsupported or invalid CSS selector: "%s"' % token)
+
+
+def attribute_checker(operator, attribute, value, get_attribute):
+    def get_value(el, default=None):
+        rv = get_attribute(el, attribute)
+        if rv is None:
+            return default
+        if isinstance(rv, list):
+            return ' '.join(rv)
+        return rv
+
+    if operator == '=':
+        return lambda el: get_value(el) == value
+    if operator == '~':
+        def includes_value(el):
+            rv = get_attribute(el, attribute)
+            if rv is None:
+                return False
+            if not isinstance(rv, list):
+                rv = rv.split()
+            return value in rv
+        return includes_value
+    if operator == '^':
+        return lambda el: get_value(el, '').startswith(value)
+    if operator == '$':
+        return lambda el: get_value(el, '').endswith(value)
+    if operator == '*':
+        return lambda el: value in get_value(el, '')
+    if operator == '|':
+        def is_or_starts_with_dash(el):
+            rv = get_value(el, '')
+            return rv == value or rv.startswith(value + '-')
+        return is_or_starts_with_dash
+    return lambda el: get_attribute(el, attribute) is not None
+
+
+class RuleSelector(object):
+    """CSS selectors of rules, e.g. ``FallbackParser.AUTHORS``, compiled
+    once, the tags of every rule are found in one walk of the document.
+
+    A rule of simple selectors joined by descendant combinators selects
+    tags in document order, which is what ``dom.select(rule)`` returns
+    for it. Along the walk, the number of leading selectors of every rule
+    matched by the ancestors is kept, a tag is selected when all of them
+    are matched and the tag matches the last one. Other rules, e.g. with
+    ``>`` or groups, are selected with ``dom.select``.
+
+    Simple selectors are indexed by the tag name, a class or the other
+    attribute they need, only the ones a tag may match are checked.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        # simple selectors, (tag name, checker)
+        self.selectors = []
+        # indexes of selectors by the tag name, by a class or the other
+        # attribute they need, and the ones to check on every tag
+        self.by_name = {}
+        self.by_class = {}
+        self.by_attribute = {}
+        self.always = []
+        # a list of indexes of selectors for each rule, or None
+        self.chains = []
+
+        tokens = {}
+        for rule in self.rules:
+            try:
+                chain = [
+                    self._add_selector(token, tokens)
+                    for token in self.compile_chain(rule)
+                ]
+            except (ValueError, NotImplementedError):
+                # selected with dom.select, which raises the errors of
+                # invalid rules when they are selected
+                chain = None
+            self.chains.append(chain)
+
+    @classmethod
+    def compile(cls, rules):
+        key = (cls, tuple(rules))
+        selector = _rule_selectors.get(key)
+        if selector is None:
+            selector = cls(rules)
+            _rule_selectors[key] = selector
+        return selector
+
+    def compile_chain(self, rule):
+        if ',' in rule:
+            raise ValueError('Groups are not selected in the walk')
+        tokens = shlex.split(rule)
+        if not tokens:
+            raise ValueError('Empty selector')
+        for token in tokens:
+            if token in COMBINATORS:
+                raise ValueError('Combinators are not selected in the walk')
+        return tokens
+
+    def _add_selector(self, token, tokens):
+        index = tokens.get(token)
+        if index is not None:
+            return index
+
+        tag_name, checker = compile_token(token, self.get_attribute)
+        index = len(self.selectors)
+        self.selectors.append((tag_name, checker))
+        tokens[token] = index
+
+        # the same branches as compile_token
+        m = ATTRIBUTE_SELECTOR.match(token)
+        if m is not None:
+            attribute = _get_required_attribute(m)
+            if attribute:
+                self.by_attribute.setdefault(attribute, []).append(index)
+            else:
+                self.always.append(index)
+        elif '#' in token:
+            self.by_attribute.setdefault('id', []).append(index)
+        elif '.' in token:
+            # a tag must have all the classes, the first one is the key
+            klass = token.split('.')[1]
+            self.by_class.setdefault(klass, []).append(index)
+        elif tag_name:
+            self.by_name.setdefault(tag_name, []).append(index)
+        else:
+            self.always.append(index)
+        return index
+
+    def select(self, dom):
+        """Yield a list of the selected tags for each rule."""
+        results = self.match(dom)
+        for rule, tags in zip(self.rules, results):
+            if tags is None:
+                tags = self.select_rule(dom, rule)
+            yield tags
+
+    def match(self, dom):
+        chains = []
+        results = []
+        for chain in self.chains:
+            if chain is None:
+                results.append(None)
+            else:
+                tags = []
+                results.append(tags)
+                chains.append((chain, len(chain) - 1, tags))
+
+        if not chains:
+            return results
+
+        iter_children = self.iter_children
+        stack = [(iter_children(dom), (0,) * len(chains))]
+        while stack:
+            children, state = stack[-1]
+            for el in children:
+                matched = self._match_selectors(el)
+                if matched:
+                    state = _advance(el, chains, state, matched)
+                stack.append((iter_children(el), state))
+                break
+            else:
+                stack.pop()
+        return results
+
+    def _match_selectors(self, el):
+        name = self.get_name(el)
+        candidates = self.by_name.get(name)
+        if candidates:
+            matched = set(candidates)
+        else:
+            matched = set()
+
+        by_attribute = self.by_attribute
+        for key in self.iter_attributes(el):
+            if key == 'class':
+                self._match_classes(el, name, matched)
+            indexes = by_attribute.get(key)
+            if indexes:
+                self._check_selectors(el, name, indexes, matched)
+
+        if self.always:
+            self._check_selectors(el, name, self.always, matched)
+        return matched
+
+    def _match_classes(self, el, name, matched):
+        by_class = self.by_class
+        for klass in self.get_attribute(el, 'class') or []:
+            indexes = by_class.get(klass)
+            if indexes:
+                self._check_selectors(el, name, indexes, matched)
+
+    def _check_selectors(self, el, name, indexes, matched):
+        for index in indexes:
+            tag_name, checker = self.selectors[index]
+            if tag_name and tag_name != name:
+                continue
+            if checker is None or checker(el):
+                matched.add(index)
+
+    @staticmethod
+    def iter_children(node):
+        for child in node.contents:
+            if isinstance(child, Tag):
+                yield child
+
+    @staticmethod
+    def get_name(node):
+        return node.name
+
+    @staticmethod
+    def iter_attributes(node):
+        return node.attrs
+
+    @staticmethod
+    def get_attribute(node, key):
+        return node.get(key)
+
+    @staticmethod
+    def select_rule(dom, rule):
+        return dom.select(rule)
+
+
+def _advance(el, chains, state, matched):
+    rv = list(state)
+    for i, (chain, last, tags) in enumerate(chains):
+        index = state[i]
+        if chain[index] in matched:
+            if index == last:
+                tags.append(el)
+            else:
+                rv[i] = index + 1
+    return tuple(rv)
+
+
+def _get_required_attribute(m):
+    # the attribute a tag must have to match an attribute selector
+    if m.group('value') or m.group('operator') in ('', '=', '~'):
+        return m.group('attribute')
+    # e.g. [title^=""] matches tags without the attribute
+    return None
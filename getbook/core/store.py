@@ -0,0 +1,74 @@
+# coding: utf-8
+
+import os
+import gzip
+import json
+import datetime
+from .utils import (
+    sha1name, touch, shard_path, atomic_write, migrate_to_shards,
+)
+
+
+class RawStore(object):
+    """Content addressed storage of fetched HTML.
+
+    Pages are saved as gzipped objects named by the sha1 of their content,
+    a small JSON ref named by the sha1 of the URL points to the object, and
+    keeps the response headers and the final URL. Pages can be parsed
+    again from the store without touching the network.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.objects_dir = os.path.join(folder, 'objects')
+        self.refs_dir = os.path.join(folder, 'refs')
+        for k in (self.objects_dir, self.refs_dir):
+            if not os.path.isdir(k):
+                os.makedirs(k)
+            else:
+                migrate_to_shards(k)
+
+    def save(self, url, final_url, content, headers=None):
+        data = content.encode('utf-8')
+        digest = sha1name(data)
+        filepath = self._object_file(digest)
+        if not os.path.isfile(filepath):
+            with atomic_write(filepath) as f:
+                f.write(gzip.compress(data))
+
+        ref = {
+            'url': url,
+            'final_url': final_url,
+            'headers': dict(headers or {}),
+            'digest': digest,
+            'fetched_at': datetime.datetime.utcnow().isoformat(),
+        }
+        content = json.dumps(ref).encode('utf-8')
+        with atomic_write(self._ref_file(url)) as f:
+            f.write(content)
+        return digest
+
+    def load(self, url):
+        filepath = self._ref_file(url)
+        if not os.path.isfile(filepath):
+            return None
+
+        with open(filepath, 'r') as f:
+            ref = json.load(f)
+
+        filepath = self._object_file(ref['digest'])
+        if not os.path.isfile(filepath):
+            return None
+
+        with gzip.open(filepath, 'rb') as f:
+            ref['content'] = f.read().decode('utf-8')
+
+        touch(filepath)
+        touch(self._ref_file(url))
+        return ref
+
+    def _ref_file(self, url):
+        return shard_path(self.refs_dir, sha1name(url) + '.json')
+
+    def _object_file(self, digest):
+        return shard_path(self.objects_dir, digest + '.html.gz')
@@ -0,0 +1,100 @@
+# coding: utf-8
+
+from bs4.element import Tag, NavigableString, CData
+from .utils import pure_text
+
+# strings counted by get_text
+TEXT_TYPES = (NavigableString, CData)
+
+
+class TextCache(object):
+    """Lengths of :func:`~getbook.core.utils.pure_text` of nodes in a
+    document, and of the text of links in them.
+
+    The lengths of a tag are summed from its children, so computing them
+    once for the root caches every node. Nodes are kept in the cache, so
+    that their ids are not reused. Change the document with
+    :meth:`extract`, :meth:`unwrap` and :meth:`replace_with`, which
+    invalidate the ancestors of the changed node, or :meth:`clear` the
+    cache after changing it in other ways.
+    """
+
+    def __init__(self):
+        # id(node) => (node, text length, link text length)
+        self._items = {}
+
+    def text_length(self, node):
+        return self._get(node)[1]
+
+    def link_text_length(self, node):
+        """Length of pure_text of every <a> in node, the nested ones are
+        counted twice."""
+        return self._get(node)[2]
+
+    def extract(self, node):
+        self.invalidate(node)
+        return node.extract()
+
+    def unwrap(self, node):
+        self.invalidate(node)
+        self._items.pop(id(node), None)
+        return node.unwrap()
+
+    def replace_with(self, node, new):
+        self.invalidate(node)
+        self.invalidate(new)
+        return node.replace_with(new)
+
+    def invalidate(self, node):
+        """Forget the ancestors of node, call it before node is moved,
+        removed or renamed."""
+        for parent in node.parents:
+            self._items.pop(id(parent), None)
+
+    def clear(self):
+        self._items = {}
+
+    def _get(self, node):
+        item = self._items.get(id(node))
+        if item is not None:
+            return item
+
+        if not isinstance(node, Tag):
+            return self._get_string(node)
+
+        # sum the lengths bottom-up, with a stack instead of recursion,
+        # documents may be deeply nested
+        stack = [(node, iter(node.contents), [0, 0])]
+        while stack:
+            el, children, sums = stack[-1]
+            for child in children:
+                item = self._items.get(id(child))
+                if item is None:
+                    if isinstance(child, Tag):
+                        stack.append((child, iter(child.contents), [0, 0]))
+                        break
+                    item = self._get_string(child)
+                _add_lengths(sums, child, item)
+            else:
+                stack.pop()
+                item = (el, sums[0], sums[1])
+                self._items[id(el)] = item
+                if stack:
+                    _add_lengths(stack[-1][2], el, item)
+        return item
+
+    def _get_string(self, node):
+        if type(node) in TEXT_TYPES:
+            item = (node, len(pure_text(node)), 0)
+        else:
+            # comments and doctypes are not a part of the text
+            item = (node, 0, 0)
+        self._items[id(node)] = item
+        return item
+
+
+def _add_lengths(sums, node, item):
+    sums[0] += item[1]
+    sums[1] += item[2]
+    if node.name == 'a':
+        sums[1] += item[1]
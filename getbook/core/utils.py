@@ -1,9 +1,10 @@
 # coding: utf-8
 
+import os
 import re
 import time
 import hashlib
-import dateutil.parser
+from contextlib import contextmanager
 from datetime import datetime, date
 from urllib.parse import urlparse
 
@@ -14,6 +15,7 @@ USELESS_IDENTS = [
 ]
 UTM_QUERY = re.compile(r'utm_\w+=[^&]+&?')
 REF_QUERY = re.compile(r'(?:source|ref|refer)=[^&]+&?')
+SHARD_NAME = re.compile(r'^[0-9a-f]{40}\.')
 
 
 def to_datetime(value):
@@ -24,6 +26,7 @@ def to_datetime(value):
     value = value.strip()
     if value.startswith('(') and value.endswith(')'):
         value = value[1:-1]
+    import dateutil.parser
     try:
         date = dateutil.parser.parse(value)
         if not date:
@@ -110,10 +113,72 @@ def sha1name(name):
     return hashlib.sha1(name).hexdigest()
 
 
+def shard_path(folder, name):
+    # cache files are spread into ab/cd/<sha1> sub folders, so that
+    # no directory grows too large
+    return os.path.join(folder, name[:2], name[2:4], name)
+
+
+def ensure_parent(filepath):
+    folder = os.path.dirname(filepath)
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+    return filepath
+
+
+def mkstemp(folder, suffix='.tmp'):
+    # like tempfile.mkstemp, but the file gets the mode of open(), the
+    # kernel applies the umask to 0666, instead of 0600
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    while True:
+        name = 'tmp{}{}'.format(os.urandom(6).hex(), suffix)
+        filepath = os.path.join(folder, name)
+        try:
+            return os.open(filepath, flags, 0o666), filepath
+        except FileExistsError:
+            continue
+
+
+@contextmanager
+def atomic_write(filepath):
+    # write into a temporary file, which is moved to filepath when the
+    # block succeeds, readers never see a partial file
+    fd, tmp = mkstemp(os.path.dirname(ensure_parent(filepath)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp, filepath)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def migrate_to_shards(folder):
+    # move cache files of the legacy flat layout into shards, after the
+    # migration only shard folders are left in the top level
+    count = 0
+    for entry in os.scandir(folder):
+        if entry.is_file() and SHARD_NAME.match(entry.name):
+            dest = ensure_parent(shard_path(folder, entry.name))
+            os.replace(entry.path, dest)
+            count += 1
+    return count
+
+
+def touch(filepath):
+    # mark a cache file as recently used, see getbook.cache
+    try:
+        os.utime(filepath, None)
+    except OSError:
+        pass
+
+
 def format_date(value, format='%Y-%m-%d'):
     if isinstance(value, (datetime, date)):
         return value.strftime(format=format)
 
+    import dateutil.parser
     rv = dateutil.parser.parse(value)
     if rv:
         return rv.strftime(format=format)
@@ -1,14 +1,38 @@
 import os
-from jinja2 import Environment, FileSystemLoader
+import threading
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 from ..core.utils import format_date
 
 _CWD = os.path.dirname(os.path.abspath(__file__))
 
+_lock = threading.Lock()
+_envs = {}
+
+
+def get_jinja(cache_dir=None):
+    """Get the shared Jinja environment, it is created on first use. The
+    compiled templates are cached in ``cache_dir``, so that they are not
+    compiled again in every process."""
+    with _lock:
+        jinja = _envs.get(cache_dir)
+        if jinja is None:
+            jinja = create_jinja(cache_dir)
+            _envs[cache_dir] = jinja
+        return jinja
+
+
+def create_jinja(cache_dir=None):
+    if cache_dir:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    else:
+        bytecode_cache = None
 
-def create_jinja():
     loaders = [os.path.join(_CWD, 'templates')]
     jinja = Environment(
         loader=FileSystemLoader(loaders),
+        bytecode_cache=bytecode_cache,
         trim_blocks=True,
         lstrip_blocks=True,
         autoescape=False,
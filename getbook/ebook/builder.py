@@ -1,29 +1,29 @@
 import os
 import re
+import json
 import shutil
-import zipfile
 import logging
-import requests
+import datetime
 
 from collections import Counter
 from subprocess import Popen, PIPE
-from .processor import replace_content_images, create_book_cover
-from ._jinja import create_jinja
-from .. import __homepage__ as homepage
+from .processor import (
+    replace_content_images, create_book_cover, create_image_model,
+)
+from .images import ImagePipeline
+from .epub import EpubWriter, STATIC_DIR
+from .manifest import BookManifest
+from ._jinja import get_jinja
+from ..core import fetcher
+from ..core.utils import sha1name
+from .. import __version__ as version, __homepage__ as homepage
 
 log = logging.getLogger(__name__)
 
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-STATIC_DIR = os.path.join(BASE_DIR, 'static')
-with open(os.path.join(STATIC_DIR, 'container.xml'), 'rb') as f:
-    EPUB_CONTAINER = f.read()
-EPUB_MIME_TYPE = b'application/epub+zip'
 STYLE_WHITE_SPACE = re.compile(r'\n+\s*')
 
 
 class BookBuilder(object):
-    _jinja = create_jinja()
-
     def __init__(self, book, cache_dir, config):
         config.setdefault('GENERATOR_NAME', 'getbook')
         config.setdefault('GENERATOR_URL', homepage)
@@ -35,22 +35,51 @@ class BookBuilder(object):
 
         self._lang_counter = Counter()
         self._cover = None
+        self._image_pipeline = None
+        self._epub = None
+        self._content_changed = True
 
-        if not os.path.isdir(self.book_dir):
-            os.makedirs(self.book_dir)
+        # files in the book directory are only written when they changed
+        self.manifest = BookManifest(self.book_dir, self._manifest_version())
+
+    def stream_epub(self, output):
+        """Write the EPUB file into ``output`` folder directly, instead of
+        the book directory. It must be called before writing chapters."""
+        dest = os.path.join(output, self.book.uid + '.epub')
+        self._epub = self._create_epub_writer(dest)
+        self.manifest = None
 
     def write_template(self, template, params, dest):
-        tpl = self._jinja.get_template(template)
-        content = tpl.render(params)
-        self._write(content, dest)
+        jinja = get_jinja(os.path.join(self.cache_dir, 'jinja'))
+        tpl = jinja.get_template(template)
+        if self._epub is not None:
+            self._epub.write_chunks(dest, tpl.generate(params))
+        else:
+            self._write(tpl.render(params), dest)
 
     def write_chapter(self, chapter):
-        self._prepare_chapter_images(chapter)
+        uid = chapter['uid']
+        manifest = self.manifest
+        if manifest is not None:
+            digest = sha1name(json.dumps(chapter, sort_keys=True, default=str))
+            names = manifest.get_chapter(uid, digest)
+            if names is not None:
+                # not changed since the last build
+                for name in names:
+                    image = create_image_model(self._book_file(name))
+                    self.book.images.add(image)
+                manifest.add_chapter(uid, digest, names)
+                self._post_process_chapter(chapter)
+                return
+
+        images = self._prepare_chapter_images(chapter)
         self.write_template(
             'chapter.html',
             {'chapter': chapter},
-            '{}.xhtml'.format(chapter['uid'])
+            '{}.xhtml'.format(uid)
         )
+        if manifest is not None:
+            manifest.add_chapter(uid, digest, [img.href for img in images])
         self._post_process_chapter(chapter)
 
     def write_section(self, section):
@@ -90,13 +119,25 @@ class BookBuilder(object):
             book.cover = None
             return False
 
+        manifest = self.manifest
+        if manifest is not None:
+            src = manifest.extra.pop('cover', None)
+            if (src and not self._content_changed and
+                    manifest.has_file('cover.jpg')):
+                manifest.keep('cover.jpg')
+                manifest.extra['cover'] = src
+                book.cover = src
+                return True
+
         image_dir = os.path.join(self.cache_dir, 'img')
 
         def _create_cover(src):
             cover = create_book_cover(self.config, book, src, image_dir)
             if cover:
-                cover.save(os.path.join(self.book_dir, 'cover.jpg'))
+                self._save_cover(cover)
                 book.cover = src
+                if manifest is not None:
+                    manifest.extra['cover'] = src
                 return True
             return False
 
@@ -121,8 +162,12 @@ class BookBuilder(object):
             log.warn('kindlgen is not configured')
             return
 
-        log.info('MOBI: {}'.format(output))
         self.write_stylesheet('reset', 'layout', 'mobi')
+        if self.manifest.is_built(output):
+            log.info('MOBI is up to date: {}'.format(output))
+            return
+
+        log.info('MOBI: {}'.format(output))
         opf_file = os.path.join(self.book_dir, 'package.opf')
         cmd = [kindlegen, '-dont_append_source', opf_file]
         p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
@@ -133,25 +178,48 @@ class BookBuilder(object):
 
         mobi_file = os.path.join(self.book_dir, 'package.mobi')
         shutil.move(mobi_file, output)
+        self.manifest.set_built(output)
 
     def create_epub(self, output):
-        log.info('EPUB: {}'.format(output))
-
         self.write_stylesheet('reset', 'layout', 'highlight', 'epub')
-        with zipfile.ZipFile(output, 'w') as z:
-            z.writestr('META-INF/container.xml', EPUB_CONTAINER)
-            z.writestr('mimetype', EPUB_MIME_TYPE)
-
-            for name in os.listdir(self.book_dir):
-                if name.endswith('.mobi'):
-                    continue
-                filepath = os.path.join(self.book_dir, name)
-                with open(filepath, 'rb') as f:
-                    content = f.read()
-                    z.writestr('OEBPS/' + name, content)
+        if self.manifest.is_built(output):
+            log.info('EPUB is up to date: {}'.format(output))
+            return
+
+        log.info('EPUB: {}'.format(output))
+        z = self._create_epub_writer(output)
+        for name in self.manifest.names:
+            z.write_file(name, os.path.join(self.book_dir, name))
+        z.close()
+        self.manifest.set_built(output)
 
     def build(self, output, epub=True, mobi=True):
+        try:
+            self._build(output, epub, mobi)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._close_image_pipeline()
+        # self.cleanup()
+
+    def abort(self):
+        """Discard the EPUB file being streamed, when the book can not
+        be built, e.g. writing chapters failed."""
+        if self._epub is not None:
+            self._epub.abort()
+            self._epub = None
+        self._close_image_pipeline()
+
+    def _close_image_pipeline(self):
+        if self._image_pipeline is not None:
+            self._image_pipeline.close()
+            self._image_pipeline = None
+
+    def _build(self, output, epub, mobi):
         book = self._prepare_book()
+        if self.manifest is not None:
+            self._check_content(book)
         self.write_cover(book)
 
         for sec in book.sections:
@@ -161,17 +229,52 @@ class BookBuilder(object):
         self.write_preface(book)
         self.write_opf(book)
 
-        if not os.path.isdir(output):
-            os.makedirs(output)
-
-        if epub:
+        if self._epub is not None:
+            log.info('EPUB: {}'.format(self._epub.filepath))
+            self.write_stylesheet('reset', 'layout', 'highlight', 'epub')
+            self._epub.close()
+            self._epub = None
+        elif epub:
+            if not os.path.isdir(output):
+                os.makedirs(output)
             dest = os.path.join(output, book.uid + '.epub')
             self.create_epub(dest)
 
         if mobi:
+            if not os.path.isdir(output):
+                os.makedirs(output)
             dest = os.path.join(output, book.uid + '.mobi')
             self.create_mobi(dest)
-        # self.cleanup()
+
+        if self.manifest is not None:
+            if isinstance(book.pubdate, datetime.datetime):
+                self.manifest.extra['pubdate'] = book.pubdate.isoformat()
+            self.manifest.save()
+
+    def _check_content(self, book):
+        manifest = self.manifest
+        content = manifest.get_content_digest(
+            book.uid, book.title, book.author, book.lang, book.cover,
+            [s.title for s in book.sections],
+        )
+        self._content_changed = content != manifest.content
+        manifest.content = content
+        if self._content_changed:
+            return
+
+        # keep the date of an unchanged book, so that the generated files,
+        # e.g. package.opf and the cover, are not changed by the date only
+        pubdate = manifest.extra.get('pubdate')
+        if pubdate and isinstance(book.pubdate, datetime.datetime):
+            pubdate = datetime.datetime.fromisoformat(pubdate)
+            if pubdate.tzinfo == book.pubdate.tzinfo:
+                book.pubdate = min(pubdate, book.pubdate)
+
+    def _manifest_version(self):
+        # changing these settings changes every file of the book
+        keys = ('EBOOK_IMAGE_PROFILE', 'EBOOK_DEFLATE_LEVEL')
+        value = [version] + [self.config.get(k) for k in keys]
+        return sha1name(json.dumps(value, sort_keys=True))
 
     def _prepare_book(self):
         if not self._lang_counter:
@@ -183,12 +286,46 @@ class BookBuilder(object):
         book.lang = lang
         return book
 
+    def _create_epub_writer(self, dest):
+        return EpubWriter(
+            dest, compresslevel=self.config.get('EBOOK_DEFLATE_LEVEL'))
+
+    @property
+    def image_pipeline(self):
+        if self._image_pipeline is None:
+            self._image_pipeline = ImagePipeline(
+                os.path.join(self.cache_dir, 'img'),
+                workers=self.config.get('GENERATOR_IMAGE_WORKERS', 4),
+                processes=self.config.get('GENERATOR_IMAGE_PROCESSES'),
+                profile=self.config.get('EBOOK_IMAGE_PROFILE'),
+            )
+        return self._image_pipeline
+
     def _prepare_chapter_images(self, chapter):
         image_dir = os.path.join(self.cache_dir, 'img')
-        for img in replace_content_images(chapter, image_dir):
+        images = replace_content_images(
+            chapter, image_dir, self.image_pipeline)
+        for img in images:
             self.book.images.add(img)
-            dest = os.path.join(self.book_dir, img.href)
-            shutil.copy(img.filepath, dest)
+            if self._epub is not None:
+                self._epub.write_file(img.href, img.filepath)
+                continue
+
+            # image names are derived from their URLs
+            digest = sha1name('{}:{}'.format(
+                img.filepath, os.path.getsize(img.filepath)))
+            if not self.manifest.has_file(img.href, digest):
+                shutil.copy(img.filepath, self._book_file(img.href))
+            self.manifest.add_file(img.href, digest)
+        return images
+
+    def _save_cover(self, cover):
+        if self._epub is not None:
+            with self._epub.open('cover.jpg') as f:
+                cover.cover.save(f, 'JPEG')
+        else:
+            cover.save(self._book_file('cover.jpg'))
+            self.manifest.add_file('cover.jpg')
 
     def _post_process_chapter(self, chapter):
         lang = chapter.get('lang')
@@ -210,7 +347,7 @@ class BookBuilder(object):
         if not client_id:
             return None
         url = 'https://api.unsplash.com/photos/random'
-        resp = requests.get(url, params={'client_id': client_id})
+        resp = fetcher.get(url, params={'client_id': client_id}, timeout=15)
         data = resp.json()
         return data['urls']['full']
 
@@ -218,9 +355,16 @@ class BookBuilder(object):
         if not isinstance(content, bytes):
             content = content.encode('utf-8')
 
-        dest = os.path.join(self.book_dir, dest)
-        with open(dest, 'wb') as f:
-            f.write(content)
+        if self._epub is not None:
+            self._epub.write(dest, content)
+        else:
+            self.manifest.write(dest, content)
+
+    def _book_file(self, name):
+        # the book directory is only needed when the EPUB is not streamed
+        if not os.path.isdir(self.book_dir):
+            os.makedirs(self.book_dir)
+        return os.path.join(self.book_dir, name)
 
 
 def read_static_file(name):
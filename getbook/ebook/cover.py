@@ -27,7 +27,11 @@ class Cover(object):
         self.draw = ImageDraw.Draw(self.cover)
         self.style = 0
 
-    def draw_background(self, cover_file):
+    def draw_background(self, cover_file, size=None):
+        # size is recorded in the image index, avoid opening small images
+        if size and size[0] and size[0] < self.WIDTH:
+            return False
+
         img = Image.open(cover_file, 'r')
         w, h = img.size
         if w >= self.WIDTH and h >= self.HEIGHT:
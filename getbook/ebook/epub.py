@@ -0,0 +1,104 @@
+import os
+import time
+import zipfile
+import logging
+from ..core.utils import mkstemp
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+with open(os.path.join(STATIC_DIR, 'container.xml'), 'rb') as f:
+    EPUB_CONTAINER = f.read()
+EPUB_MIME_TYPE = b'application/epub+zip'
+
+# compressed already, deflating them again only wastes time
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+
+class EpubWriter(object):
+    """Write an EPUB file entry by entry.
+
+    Rendered templates and cached images are streamed into the zip file,
+    nothing is copied to the book directory, and no file is read into
+    memory as a whole. Every name is written only once.
+
+    The ``mimetype`` entry is written first and uncompressed, as required
+    by the OCF spec, images are stored, and text entries are deflated at
+    ``compresslevel``.
+    """
+
+    def __init__(self, filepath, compresslevel=None):
+        self.filepath = filepath
+        folder = os.path.dirname(os.path.abspath(filepath))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # the EPUB is moved to filepath when it is complete
+        fd, self._tmp = mkstemp(folder)
+        os.close(fd)
+        self._zip = zipfile.ZipFile(
+            self._tmp, 'w',
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=compresslevel,
+        )
+        self._names = set()
+        self._zip.writestr(
+            'mimetype', EPUB_MIME_TYPE, compress_type=zipfile.ZIP_STORED)
+        self._zip.writestr('META-INF/container.xml', EPUB_CONTAINER)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def write(self, name, content):
+        if self._add_name(name):
+            self._zip.writestr(
+                'OEBPS/' + name, content, compress_type=_compress_type(name))
+
+    def write_chunks(self, name, chunks):
+        if not self._add_name(name):
+            return
+        with self._open(name) as f:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                f.write(chunk)
+
+    def write_file(self, name, filepath):
+        if self._add_name(name):
+            self._zip.write(
+                filepath, 'OEBPS/' + name,
+                compress_type=_compress_type(name))
+
+    def open(self, name):
+        if not self._add_name(name):
+            raise RuntimeError('Duplicated entry: {}'.format(name))
+        return self._open(name)
+
+    def close(self):
+        self._zip.close()
+        os.replace(self._tmp, self.filepath)
+
+    def abort(self):
+        self._zip.close()
+        os.remove(self._tmp)
+
+    def _open(self, name):
+        arcname = 'OEBPS/' + name
+        if _compress_type(name) == zipfile.ZIP_STORED:
+            # a ZipInfo is stored by default
+            arcname = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        return self._zip.open(arcname, 'w')
+
+    def _add_name(self, name):
+        if name in self._names:
+            log.debug('Skip duplicated entry: {}'.format(name))
+            return False
+        self._names.add(name)
+        return True
+
+
+def _compress_type(name):
+    if os.path.splitext(name)[-1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
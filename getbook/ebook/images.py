@@ -2,10 +2,18 @@ import logging
 import mimetypes
 import hashlib
 import os
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, as_completed,
+)
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
 
-import requests
 from PIL import Image
+from ..core.fetcher import scheduler, throttle, get_session
+from ..core.utils import touch, shard_path, ensure_parent, atomic_write
+from .index import get_index
 
 log = logging.getLogger(__name__)
 
@@ -14,75 +22,335 @@ THUMBNAIL_HEIGHT = 1000
 
 IMAGE_EXTENSIONS = ['jpeg', 'png', 'gif', 'svg']
 LIMIT_EXTENSIONS = ['.jpeg', '.png', '.jpg']
+GIF_EXTENSIONS = ['.gif']
 
+ImageProfile = namedtuple('ImageProfile', [
+    'name', 'width', 'height', 'quality', 'grayscale', 'progressive',
+    'first_frame',
+])
 
-def fetch_thumbnail(src, image_dir, referrer=None):
+# first_frame turns GIFs into a JPEG of their first frame, readers that
+# can not play animations only show the first frame anyway
+IMAGE_PROFILES = {
+    'default': ImageProfile(
+        'default', THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, 75, False, False, False),
+    'eink': ImageProfile('eink', 600, 800, 60, True, False, True),
+    'tablet': ImageProfile('tablet', 1200, 1600, 80, False, True, False),
+    'tiny': ImageProfile('tiny', 400, 600, 50, False, True, True),
+}
+DEFAULT_PROFILE = IMAGE_PROFILES['default']
+
+ThumbnailJob = namedtuple('ThumbnailJob', ['name', 'source', 'dest'])
+
+# Image.reduce raises ValueError for other modes, e.g. P, 1 and I;16
+REDUCE_MODES = (
+    'L', 'LA', 'La', 'PA', 'RGB', 'RGBA', 'RGBa', 'RGBX', 'CMYK', 'YCbCr',
+    'I', 'F',
+)
+
+
+def get_image_profile(value=None):
+    """Get an image profile by name, or create one from a dict, missing
+    keys are taken from the profile named by its ``base`` key, which is
+    ``default`` by default.
+    """
+    if value is None:
+        return DEFAULT_PROFILE
+    if isinstance(value, ImageProfile):
+        return value
+    if isinstance(value, str):
+        if value not in IMAGE_PROFILES:
+            raise RuntimeError('Unknown image profile: {}'.format(value))
+        return IMAGE_PROFILES[value]
+
+    value = dict(value)
+    base = get_image_profile(value.pop('base', None))
+    profile = base._replace(**value)
+    if 'name' not in value:
+        # the name is a part of thumbnail file names
+        digest = hashlib.sha1(repr(profile[1:]).encode('utf-8')).hexdigest()
+        profile = profile._replace(name='custom-' + digest[:8])
+    return profile
+
+
+class ImagePipeline(object):
+    """Fetch thumbnails of many images concurrently.
+
+    Images are looked up and downloaded in a thread pool, and resized
+    in a process pool as soon as they are downloaded.
+    """
+
+    def __init__(self, image_dir, workers=4, processes=None, profile=None):
+        self.image_dir = image_dir
+        self.profile = get_image_profile(profile)
+        self.workers = max(workers, 1)
+        # processes=None means cpu count, 0 disables the process pool
+        self.processes = processes
+        self._threads = None
+        self._processes = None
+
+    def fetch_thumbnails(self, srcs, referrer=None):
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers)
+
+        futures = {}
+        for src in set(srcs):
+            future = self._threads.submit(
+                prepare_thumbnail, src, self.image_dir, referrer,
+                self.profile)
+            futures[future] = src
+
+        results = {}
+        resizing = []
+        for future in as_completed(futures):
+            src = futures[future]
+            job = future.result()
+            if isinstance(job, ThumbnailJob):
+                resizing.append((src, job, self._resize(job)))
+            else:
+                results[src] = job
+
+        for src, job, future in resizing:
+            try:
+                ok = future.result()
+            except BrokenProcessPool:
+                ok = resize_image(job.source, job.dest, self.profile)
+            results[src] = finish_thumbnail(job, self.image_dir, ok)
+        return [results[src] for src in srcs]
+
+    def close(self):
+        if self._threads is not None:
+            self._threads.shutdown()
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown()
+            self._processes = None
+
+    def _resize(self, job):
+        if self.processes == 0:
+            executor = self._threads
+        else:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=_get_mp_context(),
+                )
+            executor = self._processes
+        return executor.submit(
+            resize_image, job.source, job.dest, self.profile)
+
+
+def _get_mp_context():
+    # chapters are still fetched in threads when the pool starts, a forked
+    # worker may inherit a lock held by one of them, e.g. of logging
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def fetch_thumbnail(src, image_dir, referrer=None, profile=None):
+    profile = get_image_profile(profile)
+    job = prepare_thumbnail(src, image_dir, referrer, profile)
+    if not isinstance(job, ThumbnailJob):
+        return job
+    ok = resize_image(job.source, job.dest, profile)
+    return finish_thumbnail(job, image_dir, ok)
+
+
+def prepare_thumbnail(src, image_dir, referrer=None, profile=DEFAULT_PROFILE):
+    # returns the path of the thumbnail if it is ready, otherwise a
+    # ThumbnailJob that needs resize_image and finish_thumbnail
     name = hashlib.sha1(src.encode('utf-8')).hexdigest()
-    dest = _find_in_cache(name, None, image_dir)
-    if dest:
-        return dest
+    if profile != DEFAULT_PROFILE:
+        # every profile has its own thumbnail
+        name = '{}.{}'.format(name, profile.name)
 
-    filepath = get_or_download_image(src, image_dir, referrer)
-    if not filepath:
+    index = get_index(image_dir)
+    item = index.get(name)
+    if item and item['thumbnail']:
+        if os.path.isfile(item['thumbnail']):
+            touch(item['thumbnail'])
+            return item['thumbnail']
+        # removed from the cache folder, but not from the index
+        index.discard([item['thumbnail']])
+
+    info = get_image_info(src, image_dir, referrer)
+    if not info:
         return None
 
-    ext = os.path.splitext(filepath)[-1]
-    if ext not in LIMIT_EXTENSIONS:
+    filepath = info['filepath']
+    if not _need_resize(info, profile):
+        index.update(name, thumbnail=filepath)
         return filepath
 
-    dest = os.path.join(image_dir, '{}.jpg'.format(name))
-    folder = os.path.dirname(dest)
-    if not os.path.isdir(folder):
-        os.makedirs(folder)
+    dest = ensure_parent(shard_path(image_dir, '{}.jpg'.format(name)))
+    return ThumbnailJob(name, filepath, dest)
 
+
+def resize_image(source, dest, profile=DEFAULT_PROFILE):
+    # it runs in a worker process, keep it free of shared state
+    box = (profile.width, profile.height)
     try:
-        img = Image.open(filepath, 'r')
-        img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
-        img.save(dest, optimize=True, quality=75)
-    except OSError:
+        with Image.open(source, 'r') as img:
+            if img.format == 'JPEG':
+                # let libjpeg decode at 1/2, 1/4 or 1/8 scale, instead of
+                # decoding the full image just to shrink it
+                img.draft('L' if profile.grayscale else 'RGB', box)
+            else:
+                # only the first frame of animated images is loaded
+                img = _reduce_image(img, box)
+            img.thumbnail(box, Image.LANCZOS)
+            if profile.grayscale:
+                mode = 'L'
+            elif img.mode not in ('RGB', 'L'):
+                mode = 'RGB'
+            else:
+                mode = img.mode
+            if img.mode != mode:
+                img = img.convert(mode)
+            with atomic_write(dest) as f:
+                img.save(
+                    f, 'JPEG', optimize=True, quality=profile.quality,
+                    progressive=profile.progressive,
+                )
+    except (OSError, ValueError):
+        # broken images, or modes that can not be converted
+        log.warning('Can not resize image: {}'.format(source))
+        return False
+    return True
+
+
+def _reduce_image(img, box):
+    # cheap integer downscale of oversized images, keep twice the size of
+    # the box so that the final resample is still good quality
+    factor = min(img.size[0] // (box[0] * 2), img.size[1] // (box[1] * 2))
+    if factor < 2 or not hasattr(img, 'reduce'):
+        return img
+    if img.mode not in REDUCE_MODES:
+        # the thumbnail is converted to RGB or L anyway
+        img = img.convert('RGB')
+    return img.reduce(factor)
+
+
+def _need_resize(info, profile):
+    ext = os.path.splitext(info['filepath'])[-1]
+    if ext in GIF_EXTENSIONS:
+        return profile.first_frame
+    if ext not in LIMIT_EXTENSIONS:
+        # svg can not be rasterized without extra dependencies
+        return False
+    if profile.grayscale:
+        return True
+    return not _fits_thumbnail(info, profile)
+
+
+def _fits_thumbnail(info, profile):
+    # image is small enough already, no need to decode and encode again
+    w, h = info['width'], info['height']
+    if not w or not h:
+        return False
+    return w <= profile.width and h <= profile.height
+
+
+def finish_thumbnail(job, image_dir, ok):
+    if not ok:
         return None
-    return dest
+    get_index(image_dir).update(job.name, thumbnail=job.dest)
+    return job.dest
 
 
 def get_or_download_image(src, image_dir, referrer=None):
+    info = get_image_info(src, image_dir, referrer)
+    if info:
+        return info['filepath']
+
+
+def get_image_info(src, image_dir, referrer=None):
+    """Get the cached image of ``src``, download it if necessary.
+
+    The returned dict contains filepath, mimetype, width, height, format
+    and size, they are recorded once when the image is downloaded.
+    """
     name = hashlib.sha1(src.encode('utf-8')).hexdigest()
+    index = get_index(image_dir)
+    item = index.get(name)
+    # size is missing in items recorded by older versions
+    if item and item['filepath'] and item['size'] is not None:
+        if os.path.isfile(item['filepath']):
+            touch(item['filepath'])
+            return item
+        index.discard([item['filepath']])
+
     d = urlparse(src)
     ct = mimetypes.guess_type(d.path)[0]
     ext = _get_extname(ct)
-    dest = _find_in_cache(name, ext, image_dir)
-    if dest:
-        return dest
 
-    try:
+    # images cached before the index existed
+    dest = _find_in_cache(name, ext, image_dir)
+    if not dest:
         if referrer:
             headers = {'Referer': referrer}
         else:
             headers = None
-        req = requests.get(src, timeout=15, stream=True, headers=headers)
+
+        # hold the host slot until the whole body is downloaded
+        with scheduler.acquire(src):
+            dest = _download_image(src, name, ext, image_dir, headers)
+
+    if dest:
+        return _add_to_index(index, name, dest)
+
+
+def _download_image(src, name, ext, image_dir, headers):
+    try:
+        session = get_session()
+        req = session.get(src, timeout=15, stream=True, headers=headers)
     except Exception as e:
         log.exception(e)
         return None
 
+    throttle(src, req)
     if req.status_code != 200:
+        req.close()
         return None
 
     if not ext:
         ext = _get_extname(req.headers.get('Content-Type'))
 
     if not ext:
+        req.close()
         return None
 
-    dest = os.path.join(image_dir, '{}.{}'.format(name, ext))
-    folder = os.path.dirname(dest)
-    if not os.path.isdir(folder):
-        os.makedirs(folder)
+    dest = shard_path(image_dir, '{}.{}'.format(name, ext))
 
-    with open(dest, 'wb') as f:
-        for chunk in req:
+    # write to a temporary file first, chapters are fetched concurrently
+    # and the same image may be downloaded by another thread
+    with atomic_write(dest) as f:
+        for chunk in req.iter_content(chunk_size=65536):
             f.write(chunk)
     return dest
 
 
+def _add_to_index(index, name, filepath):
+    info = {
+        'filepath': filepath,
+        'mimetype': mimetypes.guess_type(filepath)[0],
+        'width': None,
+        'height': None,
+        'format': None,
+        'size': os.path.getsize(filepath),
+    }
+    try:
+        # only the header is read here
+        with Image.open(filepath) as img:
+            info['width'], info['height'] = img.size
+            info['format'] = img.format
+    except OSError:
+        pass
+    index.update(name, **info)
+    return info
+
+
 def _find_in_cache(name, ext, image_dir):
     if ext:
         ext_names = [ext]
@@ -90,8 +358,9 @@ def _find_in_cache(name, ext, image_dir):
         ext_names = IMAGE_EXTENSIONS
 
     for suffix in ext_names:
-        dest = os.path.join(image_dir, '{}.{}'.format(name, suffix))
+        dest = shard_path(image_dir, '{}.{}'.format(name, suffix))
         if os.path.isfile(dest):
+            touch(dest)
             return dest
 
 
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+
+INDEX_NAME = 'index.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    name TEXT PRIMARY KEY,
+    filepath TEXT,
+    mimetype TEXT,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    size INTEGER,
+    thumbnail TEXT
+)
+'''
+COLUMNS = (
+    'filepath', 'mimetype', 'width', 'height', 'format', 'size', 'thumbnail',
+)
+PATH_COLUMNS = ('filepath', 'thumbnail')
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+class ImageIndex(object):
+    """A persistent index of the image cache.
+
+    It maps the sha1 name of an image source to the downloaded file, its
+    mimetype, dimensions, format and byte size, and the generated
+    thumbnail, so that a cache hit costs one lookup instead of probing
+    files on disk. Paths are stored relative to the image folder.
+    """
+
+    def __init__(self, image_dir):
+        self.image_dir = image_dir
+        self.filepath = os.path.join(image_dir, INDEX_NAME)
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        # sqlite connections can not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.filepath, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+            _migrate_columns(conn)
+            self._local.conn = conn
+        return conn
+
+    def get(self, name):
+        cursor = self.db.execute(
+            'SELECT {} FROM images WHERE name=?'.format(','.join(COLUMNS)),
+            (name,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+        data = dict(zip(COLUMNS, row))
+        for k in PATH_COLUMNS:
+            if data[k]:
+                data[k] = os.path.join(self.image_dir, data[k])
+        return data
+
+    def update(self, name, **kwargs):
+        for k in PATH_COLUMNS:
+            if kwargs.get(k):
+                kwargs[k] = os.path.relpath(kwargs[k], self.image_dir)
+
+        keys = [k for k in COLUMNS if k in kwargs]
+        params = [kwargs[k] for k in keys]
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO images (name) VALUES (?)', (name,))
+            if keys:
+                sql = 'UPDATE images SET {} WHERE name=?'.format(
+                    ','.join('{}=?'.format(k) for k in keys))
+                self.db.execute(sql, params + [name])
+
+    def discard(self, filepaths):
+        """Forget the given files, e.g. after they are pruned."""
+        paths = [os.path.relpath(p, self.image_dir) for p in filepaths]
+        with self.db:
+            for p in paths:
+                self.db.execute('DELETE FROM images WHERE filepath=?', (p,))
+                self.db.execute(
+                    'UPDATE images SET thumbnail=NULL WHERE thumbnail=?', (p,))
+
+
+def _migrate_columns(conn):
+    # add columns missing in indexes created by older versions
+    names = {row[1] for row in conn.execute('PRAGMA table_info(images)')}
+    for k in COLUMNS:
+        if k not in names:
+            kind = 'INTEGER' if k in ('width', 'height', 'size') else 'TEXT'
+            conn.execute('ALTER TABLE images ADD COLUMN {} {}'.format(k, kind))
+
+
+def get_index(image_dir):
+    image_dir = os.path.abspath(image_dir)
+    with _lock:
+        index = _indexes.get(image_dir)
+        if index is None:
+            index = ImageIndex(image_dir)
+            _indexes[image_dir] = index
+        return index
@@ -0,0 +1,157 @@
+import os
+import json
+import hashlib
+import logging
+from ..core.utils import sha1name
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class BookManifest(object):
+    """Content hashes of the files in a book directory.
+
+    Files are only written when their content changed, chapters whose
+    data did not change since the last build are not rendered again, and
+    an output file is only packed again when the files it contains
+    changed. Files that are not a part of the current build are removed
+    from the book directory in :meth:`save`.
+    """
+
+    def __init__(self, book_dir, version):
+        self.book_dir = book_dir
+        self.filepath = os.path.join(book_dir, MANIFEST_NAME)
+        self.version = version
+
+        data = self._load()
+        # files on disk, name => digest
+        self.files = data.get('files', {})
+        self.outputs = data.get('outputs', {})
+        # digest of chapters and book metadata, and things derived from
+        # them in the last build, e.g. cover and pubdate
+        self.content = data.get('content')
+        self.extra = data.get('extra', {})
+        self._chapters = data.get('chapters', {})
+
+        self.chapters = {}
+        self._used = set()
+
+    def _load(self):
+        if not os.path.isfile(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            return {}
+        if data.get('version') != self.version:
+            # built by another version or with other settings
+            return {}
+        return data
+
+    def write(self, name, content):
+        digest = sha1name(content)
+        self._used.add(name)
+        if self.has_file(name, digest):
+            return False
+        self._ensure_dir()
+        with open(self._path(name), 'wb') as f:
+            f.write(content)
+        self.files[name] = digest
+        return True
+
+    def add_file(self, name, digest=None):
+        """Record a file written to the book directory by others."""
+        if digest is None:
+            digest = file_digest(self._path(name))
+        self._used.add(name)
+        self.files[name] = digest
+
+    def has_file(self, name, digest=None):
+        if name not in self.files or not os.path.isfile(self._path(name)):
+            return False
+        return digest is None or self.files[name] == digest
+
+    def keep(self, name):
+        self._used.add(name)
+
+    def get_chapter(self, uid, digest):
+        """Get the image names of an unchanged chapter, or None if the
+        chapter has to be written again."""
+        item = self._chapters.get(uid)
+        if not item or item['digest'] != digest:
+            return None
+        names = ['{}.xhtml'.format(uid)] + item['images']
+        if not all(self.has_file(name) for name in names):
+            return None
+        for name in names:
+            self.keep(name)
+        return item['images']
+
+    def add_chapter(self, uid, digest, images):
+        self.chapters[uid] = {'digest': digest, 'images': images}
+
+    def get_content_digest(self, *extra):
+        chapters = {k: v['digest'] for k, v in self.chapters.items()}
+        data = {'chapters': chapters, 'extra': extra}
+        return sha1name(json.dumps(data, sort_keys=True, default=str))
+
+    @property
+    def names(self):
+        return sorted(self._used)
+
+    @property
+    def digest(self):
+        files = {k: self.files[k] for k in self._used}
+        return sha1name(json.dumps(files, sort_keys=True))
+
+    def is_built(self, dest):
+        if not os.path.isfile(dest):
+            return False
+        return self.outputs.get(os.path.abspath(dest)) == self.digest
+
+    def set_built(self, dest):
+        self.outputs[os.path.abspath(dest)] = self.digest
+
+    def save(self):
+        self._ensure_dir()
+        # files of removed chapters, and files written by older versions
+        for name in os.listdir(self.book_dir):
+            if name != MANIFEST_NAME and name not in self._used:
+                log.debug('Remove stale file: {}'.format(name))
+                _remove(self._path(name))
+        self.files = {k: v for k, v in self.files.items() if k in self._used}
+
+        data = {
+            'version': self.version,
+            'files': self.files,
+            'chapters': self.chapters,
+            'content': self.content,
+            'outputs': self.outputs,
+            'extra': self.extra,
+        }
+        with open(self.filepath, 'w') as f:
+            json.dump(data, f)
+
+    def _ensure_dir(self):
+        if not os.path.isdir(self.book_dir):
+            os.makedirs(self.book_dir)
+
+    def _path(self, name):
+        return os.path.join(self.book_dir, name)
+
+
+def file_digest(filepath):
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _remove(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
@@ -2,10 +2,9 @@ import os
 import json
 import logging
 import mimetypes
-from PIL import Image
 from bs4 import BeautifulSoup
 from .cover import Cover
-from .images import fetch_thumbnail, get_or_download_image
+from .images import fetch_thumbnail, get_image_info
 from ..core import LXML_SPACE
 from ..core import Image as ImageModel
 from ..core.utils import format_date
@@ -13,23 +12,37 @@ from ..core.utils import format_date
 log = logging.getLogger(__name__)
 
 
-def replace_content_images(data, image_dir):
+def replace_content_images(data, image_dir, pipeline=None, profile=None):
     referrer = data['url']
     content = '<div>{}</div>'.format(data['content'])
     dom = BeautifulSoup(content, LXML_SPACE)
 
+    # collect all image sources first, then fetch them together
+    tags = []
     for tag in dom.select('.tag-img'):
         attrs = json.loads(tag.get('data-attrs'))
         src = attrs.get('src')
         if not src:
             del tag.attrs['data-attrs']
             continue
+        tags.append((tag, src.strip()))
 
-        image = generate_thumbnail_image(src, image_dir, referrer)
-        if not image:
+    srcs = [src for _, src in tags]
+    if pipeline:
+        filepaths = pipeline.fetch_thumbnails(srcs, referrer)
+    else:
+        filepaths = [
+            fetch_thumbnail(src, image_dir, referrer, profile) for src in srcs
+        ]
+
+    images = []
+    for (tag, src), filepath in zip(tags, filepaths):
+        if not filepath:
             del tag.attrs['data-attrs']
             continue
-        yield image
+
+        image = create_image_model(filepath)
+        images.append(image)
 
         img = dom.new_tag('img')
         img['src'] = image.href
@@ -38,13 +51,18 @@ def replace_content_images(data, image_dir):
     body = dom.find('div')
     content = ''.join([str(el) for el in body.contents])
     data['content'] = content
+    return images
 
 
-def generate_thumbnail_image(src, image_dir, referrer):
+def generate_thumbnail_image(src, image_dir, referrer, profile=None):
     log.debug('Fetching: {}'.format(src))
-    filepath = fetch_thumbnail(src.strip(), image_dir, referrer)
+    filepath = fetch_thumbnail(src.strip(), image_dir, referrer, profile)
     if not filepath:
         return
+    return create_image_model(filepath)
+
+
+def create_image_model(filepath):
     href = os.path.basename(filepath)
     uid = href.split('.')[0]
     ct = mimetypes.guess_type(filepath)[0]
@@ -110,10 +128,9 @@ def _calc_chapter_image(data, images, best_cover, image_dir):
 
 
 def _get_image_size(src, image_dir):
-    filepath = get_or_download_image(src.strip(), image_dir)
-    if filepath and _is_valid_image(filepath):
-        img = Image.open(filepath)
-        return img.size
+    info = get_image_info(src.strip(), image_dir)
+    if info and _is_valid_image(info['filepath']) and info['width']:
+        return info['width'], info['height']
 
 
 def _is_valid_image(filepath):
@@ -128,13 +145,17 @@ def create_book_cover(config, book, src, image_dir):
     if not src:
         return None
 
-    cover_file = get_or_download_image(src, image_dir)
+    info = get_image_info(src, image_dir)
+    if not info:
+        return None
+
+    cover_file = info['filepath']
     ext = cover_file.split('.')[-1]
     if ext not in ['jpg', 'jpeg', 'png']:
         return None
 
     cover = Cover(config)
-    cover.draw_background(cover_file)
+    cover.draw_background(cover_file, (info['width'], info['height']))
 
     pubdate = format_date(book.pubdate, '%Y.%m.%d')
     cover.draw_top_text(pubdate)
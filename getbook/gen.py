@@ -1,23 +1,46 @@
 import os
 import json
+import asyncio
 import logging
 import datetime
-from .core import Book
-from .core.utils import sha1name, to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from .core import Book, NotModified, RawStore
+from .core import fetcher
+from .core.utils import (
+    sha1name, to_datetime, touch,
+    shard_path, ensure_parent, migrate_to_shards,
+)
 from .parser import Readable
 from .ebook import BookBuilder
 from .ebook.processor import update_chapter_image
+from .cache import CacheManager, DEFAULT_CACHE_DIR
 
 log = logging.getLogger(__name__)
 
+DEFAULT_WORKERS = 4
+
 
 class BookGen(object):
     def __init__(self, config, cache_dir=None):
         if cache_dir is None:
-            cache_dir = os.path.join(os.path.expanduser('~'), '.getbook/1')
+            cache_dir = DEFAULT_CACHE_DIR
+        if config is None:
+            config = {}
         self.config = config
         self.cache_dir = cache_dir
+        if config:
+            fetcher.configure(config)
+        # invalid cache limits are rejected before anything is built
+        self.cache_manager = CacheManager.from_config(cache_dir, config)
         self._ensure_folders(['data', 'book', 'img'])
+        self._migrate_folders(['data', 'img'])
+
+        # keep raw HTML, so that chapters can be extracted again offline
+        self.offline = config.get('GENERATOR_OFFLINE', False)
+        if self.offline or config.get('GENERATOR_RAW_CACHE'):
+            self.raw_store = RawStore(os.path.join(cache_dir, 'raw'))
+        else:
+            self.raw_store = None
 
     def _ensure_folders(self, names):
         for k in names:
@@ -25,17 +48,27 @@ class BookGen(object):
             if not os.path.isdir(folder):
                 os.makedirs(folder)
 
+    def _migrate_folders(self, names):
+        for k in names:
+            folder = os.path.join(self.cache_dir, k)
+            count = migrate_to_shards(folder)
+            if count:
+                log.info('Migrated {} files in {}'.format(count, folder))
+
     def gen_cache_file(self, url):
         name = sha1name(url)
-        return os.path.join(self.cache_dir, 'data', name + '.json')
+        folder = os.path.join(self.cache_dir, 'data')
+        return shard_path(folder, name + '.json')
 
     def parse(self, url, force=False):
         log.debug('Fetching: {}'.format(url))
 
         filepath = self.gen_cache_file(url)
-        if os.path.isfile(filepath) and not force:
-            return self._parse_from_cache(url, filepath)
-        return self._parse_from_network(url, filepath)
+        cached = self._load_from_cache(filepath)
+        if cached and not force:
+            log.info('From cache: {}'.format(cached['title']))
+            return cached
+        return self._parse_from_network(url, filepath, cached)
 
     def build(self, book, output=None, force=False, epub=True, mobi=True):
         if output is None:
@@ -45,69 +78,199 @@ class BookGen(object):
             book, self.cache_dir,
             config=self.config,
         )
-        self._write_chapter(book, force=force, builder=builder)
         # generate at least one format ebook
         if not epub and not mobi:
             epub = True
+        if epub and not mobi and not self.config.get('EBOOK_INCREMENTAL'):
+            # kindlegen and incremental builds need the book directory
+            builder.stream_epub(output)
+        try:
+            self._write_chapter(book, force=force, builder=builder)
+        except BaseException:
+            builder.abort()
+            raise
         builder.build(output, epub=epub, mobi=mobi)
+        self.prune_cache()
+
+    def prune_cache(self):
+        manager = self.cache_manager
+        if manager.max_bytes is None and manager.max_age is None:
+            return []
+        return manager.prune()
+
+    async def aparse(self, url, force=False, executor=None):
+        log.debug('Fetching: {}'.format(url))
+
+        loop = asyncio.get_running_loop()
+        filepath = self.gen_cache_file(url)
+        cached = await loop.run_in_executor(
+            executor, self._load_from_cache, filepath)
+        if cached and not force:
+            log.info('From cache: {}'.format(cached['title']))
+            return cached
+
+        parser = self._create_readable(url, cached)
+        if not parser:
+            return None
+        try:
+            chapter = await parser.aparse(True, executor=executor)
+        except NotModified:
+            log.info('Not modified: {}'.format(cached['title']))
+            return cached
+        except Exception as e:
+            log.warn('Error: {!r}'.format(e))
+            return None
+        return await loop.run_in_executor(
+            executor, self._save_chapter,
+            chapter, filepath, parser.validators)
+
+    async def abuild(self, book, output=None, force=False,
+                     epub=True, mobi=True):
+        if output is None:
+            output = os.getcwd()
+
+        builder = BookBuilder(
+            book, self.cache_dir,
+            config=self.config,
+        )
+        loop = asyncio.get_running_loop()
+        workers = max(self.config.get('GENERATOR_WORKERS', DEFAULT_WORKERS), 1)
+        # generate at least one format ebook
+        if not epub and not mobi:
+            epub = True
+        if epub and not mobi and not self.config.get('EBOOK_INCREMENTAL'):
+            builder.stream_epub(output)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                await self._awrite_chapter(book, force, builder, executor)
+            except BaseException:
+                builder.abort()
+                raise
+            await loop.run_in_executor(
+                executor, builder.build, output, epub, mobi)
+            await loop.run_in_executor(executor, self.prune_cache)
 
-    def _parse_from_cache(self, url, filepath):
+    def _load_from_cache(self, filepath):
+        if not os.path.isfile(filepath):
+            return None
         with open(filepath, 'r') as f:
             try:
                 data = json.load(f)
-                log.info('From cache: {}'.format(data['title']))
             except Exception:
-                data = self._parse_from_network(url, filepath)
-        return data
+                return None
+        if 'title' in data:
+            touch(filepath)
+            return data
+
+    def _create_readable(self, url, cached=None):
+        if self.offline:
+            parser = Readable.from_store(url, self.raw_store)
+            if not parser:
+                log.warn('Not in raw cache: {}'.format(url))
+            return parser
 
-    def _parse_from_network(self, url, filepath):
-        parser = Readable(url)
+        # send a conditional request when the chapter has been cached
+        return Readable(
+            url,
+            validators=_get_validators(cached),
+            store=self.raw_store,
+        )
+
+    def _parse_from_network(self, url, filepath, cached=None):
+        parser = self._create_readable(url, cached)
+        if not parser:
+            return None
         try:
             chapter = parser.parse(True)
-            if isinstance(chapter, Book):
-                return chapter
+        except NotModified:
+            log.info('Not modified: {}'.format(cached['title']))
+            return cached
         except Exception as e:
             log.warn('Error: {!r}'.format(e))
             return None
+        return self._save_chapter(chapter, filepath, parser.validators)
+
+    def _save_chapter(self, chapter, filepath, validators=None):
+        if isinstance(chapter, Book):
+            return chapter
 
         data = chapter.to_dict()
         log.info('From network: {}'.format(data['title']))
+        if validators:
+            data['validators'] = validators
 
         update_chapter_image(data, os.path.join(self.cache_dir, 'img'))
-        with open(filepath, 'w') as f:
+        with open(ensure_parent(filepath), 'w') as f:
             json.dump(data, f, cls=JSONEncoder)
         return data
 
     def _write_chapter(self, book, force=False, builder=None):
-        chapter_index = 0
-
-        def _parse_chapter(chapter, index):
-            data = self.parse(c['url'], force)
-            index += 1
-            if data:
-                uid = 'c-{}'.format(index)
-                c['uid'] = uid
-                c['status'] = 'success'
-                if 'title' not in c:
-                    c['title'] = data['title']
-
-                data['uid'] = uid
-                if builder:
-                    builder.write_chapter(data)
-            else:
-                c['status'] = 'error'
-            return index
-
-        for c in book.chapters:
-            chapter_index = _parse_chapter(c, chapter_index)
-
-        for s in book.sections:
-            for c in s.chapters:
-                chapter_index = _parse_chapter(c, chapter_index)
+        chapters = _get_book_chapters(book)
+
+        def _fetch_chapter(c):
+            return self.parse(c['url'], force)
+
+        # fetch and parse concurrently, but commit chapters in their
+        # original order, so that uid, toc and spine are deterministic
+        workers = self.config.get('GENERATOR_WORKERS', DEFAULT_WORKERS)
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            results = executor.map(_fetch_chapter, chapters)
+            for index, (c, data) in enumerate(zip(chapters, results), 1):
+                _commit_chapter(c, index, data, builder)
+
+        return book
+
+    async def _awrite_chapter(self, book, force, builder, executor):
+        chapters = _get_book_chapters(book)
+        workers = max(self.config.get('GENERATOR_WORKERS', DEFAULT_WORKERS), 1)
+        semaphore = asyncio.Semaphore(workers)
+        loop = asyncio.get_running_loop()
 
+        async def _fetch_chapter(c):
+            async with semaphore:
+                return await self.aparse(c['url'], force, executor=executor)
+
+        tasks = [asyncio.ensure_future(_fetch_chapter(c)) for c in chapters]
+        try:
+            for index, (c, task) in enumerate(zip(chapters, tasks), 1):
+                data = await task
+                await loop.run_in_executor(
+                    executor, _commit_chapter, c, index, data, builder)
+        finally:
+            for task in tasks:
+                task.cancel()
         return book
 
 
+def _get_validators(cached):
+    if cached:
+        return cached.get('validators')
+    return None
+
+
+def _get_book_chapters(book):
+    chapters = list(book.chapters)
+    for s in book.sections:
+        chapters.extend(s.chapters)
+    return chapters
+
+
+def _commit_chapter(c, index, data, builder):
+    if not data:
+        c['status'] = 'error'
+        return
+
+    uid = 'c-{}'.format(index)
+    c['uid'] = uid
+    c['status'] = 'success'
+    if 'title' not in c:
+        c['title'] = data['title']
+
+    data['uid'] = uid
+    if builder:
+        builder.write_chapter(data)
+
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, datetime.datetime):
@@ -1,7 +1,8 @@
 # coding: utf-8
 
+import asyncio
 import logging
-from .core import Chapter, FallbackParser
+from .core import Chapter, FallbackParser, fetcher
 from .sites import get_parser_by_url, get_parser_by_html
 from .sites.github import expand_gist
 
@@ -9,16 +10,39 @@ log = logging.getLogger(__name__)
 
 
 class Readable(object):
-    def __init__(self, url, html=None):
+    def __init__(self, url, html=None, validators=None, store=None):
         Parser = get_parser_by_url(url)
         if Parser:
             url = Parser.normalize_url(url)
             self._parser = Parser(url, html)
+            self._parser.store = store
+            if validators:
+                self._parser.validators = validators
         else:
             url = FallbackParser.normalize_url(url)
 
         self.url = url
         self.html = html
+        self.store = store
+        self._validators = validators or {}
+
+    @classmethod
+    def from_store(cls, url, store):
+        """Create a Readable from the HTML saved in a RawStore, it can be
+        parsed again without touching the network."""
+        url = cls(url).url
+        record = store.load(url)
+        if not record:
+            return None
+        validators = fetcher.get_validators(record['headers'])
+        return cls(record['final_url'], record['content'], validators)
+
+    @property
+    def validators(self):
+        parser = getattr(self, '_parser', None)
+        if parser:
+            return parser.validators
+        return self._validators
 
     def get_parser(self):
         parser = getattr(self, '_parser', None)
@@ -28,10 +52,12 @@ class Readable(object):
         if self.html:
             Parser = get_parser_by_html(self.html) or FallbackParser
             self._parser = Parser(self.url, self.html)
-
+            self._parser.validators = self._validators
             return self._parser
 
         p = FallbackParser(self.url)
+        p.validators = self._validators
+        p.store = self.store
         p.fetch()
 
         self.html = p.content
@@ -40,6 +66,7 @@ class Readable(object):
         if Parser:
             self.url = p.url
             self._parser = Parser(self.url, self.html)
+            self._parser.validators = p.validators
         else:
             self._parser = p
 
@@ -53,6 +80,13 @@ class Readable(object):
             chapter = self.expand(chapter)
         return chapter
 
+    async def aparse(self, expand=False, executor=None):
+        loop = asyncio.get_running_loop()
+        # fetching is I/O bound, parsing is CPU bound, they are scheduled
+        # as separated jobs, so that the event loop is never blocked
+        await loop.run_in_executor(executor, self.get_parser)
+        return await loop.run_in_executor(executor, self.parse, expand)
+
     def expand(self, chapter):
         if not chapter.attachments or 'gist' not in chapter.attachments:
             return chapter
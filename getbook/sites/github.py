@@ -1,10 +1,11 @@
 # coding: utf-8
 
 import re
+import json
 
 from bs4 import BeautifulSoup
 
-from ..core import Parser
+from ..core import Parser, fetcher
 from ..core.utils import to_datetime, get_first_child
 
 LXML_GIST = 'lxml-gist'
@@ -23,10 +24,6 @@ class GithubIssueParser(Parser):
     ALLOWED_DOMAINS = ['github.com']
     URL_PATTERN = re.compile(r'https://github\.com/.*?/(?:issues|pull)/\d+')
 
-    @classmethod
-    def check_url(cls, url):
-        return cls.URL_PATTERN.search(url)
-
     @classmethod
     def normalize_url(cls, url):
         m = cls.URL_PATTERN.findall(url)
@@ -63,10 +60,6 @@ class GithubBlobParser(Parser):
     ALLOWED_DOMAINS = ['github.com']
     URL_PATTERN = re.compile(r'https://github\.com/.*?/blob/.*')
 
-    @classmethod
-    def check_url(cls, url):
-        return cls.URL_PATTERN.search(url)
-
     @classmethod
     def normalize_url(cls, url):
         m = cls.URL_PATTERN.findall(url)
@@ -110,9 +103,11 @@ class GistParser(Parser):
     ALLOWED_DOMAINS = ['gist.github.com']
     URL_PATTERN = re.compile(r'gist\.github\.com/(?:(?:[^\/]+/.+)|\d+)')
 
-    @classmethod
-    def check_url(cls, url):
-        return cls.URL_PATTERN.search(url)
+    def __init__(self, url, content=None):
+        # the JSON text of a gist, loaded from a RawStore
+        if isinstance(content, str):
+            content = json.loads(content)
+        super(GistParser, self).__init__(url, content)
 
     @property
     def dom(self):
@@ -125,15 +120,19 @@ class GistParser(Parser):
         return self._dom
 
     def fetch(self):
-        url = self.url
+        origin = url = self.url
         if url.endswith('.js'):
             url += 'on'
         elif not url.endswith('.json'):
             url += '.json'
-        req = self._request(url)
+        req = self._request(url, self.validators)
+        self.validators = fetcher.get_validators(req.headers)
         self.content = req.json()
         self.url = url.replace('.json', '')
 
+        if self.store is not None:
+            self.store.save(origin, self.url, req.text, req.headers)
+
     def parse_lang(self):
         return None
 
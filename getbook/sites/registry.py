@@ -0,0 +1,282 @@
+# coding: utf-8
+"""
+Site parsers of plugins are entry points in the ``getbook.parsers`` group.
+A plugin whose entry point name is a hostname, e.g.::
+
+    medium.com = getbook_medium:MediumParser
+
+is only loaded when a URL of that host, or of its subdomains, is looked
+up. The name must be one of the ``ALLOWED_DOMAINS`` of the parser, or a
+parent domain of all of them, otherwise the parser is not loaded for some
+of its URLs. Plugins with other names, e.g. ``medium``, are loaded on the
+first lookup.
+"""
+
+import re
+import logging
+import threading
+import functools
+from urllib.parse import urlparse
+from collections import defaultdict
+from ..core.core_parser import Parser as BaseParser
+
+URL_CACHE_SIZE = 4096
+# flags that can be scoped to a part of a pattern
+INLINE_FLAGS = (
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+)
+# numbered groups are shifted in a combined pattern
+NUMBERED_REFERENCE = re.compile(r'\\[1-9]|\(\?\(\d')
+GROUP_PREFIX = '_url_'
+# entry point names that are loaded lazily, e.g. medium.com
+HOSTNAME = re.compile(
+    r'^(?:[a-z0-9-]+\.)+(?:[a-z]{2,}|xn--[a-z0-9-]+)$', re.IGNORECASE)
+
+log = logging.getLogger(__name__)
+
+
+class ParserRegistry(object):
+    """Site parsers, looked up by the hostname of a URL, or by HTML.
+
+    Plugins are entry points in the ``group``, they are loaded lazily,
+    see the module docstring for how they are named.
+
+    Parsers of a domain also handle its subdomains, unless a subdomain
+    has parsers of its own. Parsers of a domain are compiled into one
+    :class:`URLMatcher`, and decisions of URLs are cached.
+    """
+
+    def __init__(self, group='getbook.parsers'):
+        self.group = group
+        self.domain_parsers = defaultdict(list)
+        self.url_parsers = []
+        self.html_parsers = []
+
+        self._lock = threading.RLock()
+        self._domain_plugins = None
+        self._plugins = None
+        self._matchers = {}
+        self._lookup_url = functools.lru_cache(URL_CACHE_SIZE)(
+            self._find_by_url)
+
+    def register(self, Parser):
+        with self._lock:
+            domains = getattr(Parser, 'ALLOWED_DOMAINS', None)
+            if domains:
+                for host in domains:
+                    self.domain_parsers[host.lower()].append(Parser)
+            elif _can_match_url(Parser):
+                self.url_parsers.append(Parser)
+
+            if hasattr(Parser, 'check_html'):
+                self.html_parsers.append(Parser)
+            self._matchers = {}
+            self._lookup_url.cache_clear()
+
+    def get_parser_by_url(self, url):
+        self._load_plugins()
+        host = urlparse(url).hostname
+        if host:
+            self._load_domain_plugins(host)
+        return self._lookup_url(url)
+
+    def get_parser_by_html(self, html):
+        # any plugin may recognize the HTML
+        self._load_plugins()
+        self._load_domain_plugins(None)
+        for Parser in self.html_parsers:
+            if Parser.check_html(html):
+                return Parser
+
+    def _find_by_url(self, url):
+        host = urlparse(url).hostname
+        domain = None
+        for name in iter_domains(host):
+            if name in self.domain_parsers:
+                domain = name
+                break
+        return self._get_matcher(domain).match(url)
+
+    def _get_matcher(self, domain):
+        matcher = self._matchers.get(domain)
+        if matcher is None:
+            with self._lock:
+                if domain is None:
+                    parsers = self.url_parsers
+                else:
+                    parsers = self.domain_parsers[domain]
+                matcher = URLMatcher(parsers)
+                self._matchers[domain] = matcher
+        return matcher
+
+    def _discover(self):
+        if self._plugins is not None:
+            return
+        domain_plugins = defaultdict(list)
+        plugins = []
+        for ep in iter_entry_points(self.group):
+            if HOSTNAME.match(ep.name):
+                domain_plugins[ep.name.lower()].append(ep)
+            else:
+                plugins.append(ep)
+        self._domain_plugins = domain_plugins
+        self._plugins = plugins
+
+    def _load_plugins(self):
+        if self._plugins == []:
+            return
+        with self._lock:
+            self._discover()
+            plugins, self._plugins = self._plugins, []
+            for ep in plugins:
+                self.register(ep.load())
+
+    def _load_domain_plugins(self, host):
+        # host=None loads plugins of every domain
+        if not self._domain_plugins:
+            return
+        with self._lock:
+            if host is None:
+                hosts = list(self._domain_plugins)
+            else:
+                hosts = iter_domains(host)
+            for k in hosts:
+                for ep in self._domain_plugins.pop(k, []):
+                    self._register_domain_plugin(k, ep.load())
+
+    def _register_domain_plugin(self, name, Parser):
+        domains = getattr(Parser, 'ALLOWED_DOMAINS', None)
+        if not domains or not all(
+                name in iter_domains(host.lower()) for host in domains):
+            log.warning(
+                'Plugin {} is loaded lazily for {}, which is not a domain '
+                'of its ALLOWED_DOMAINS'.format(Parser.__name__, name))
+        self.register(Parser)
+
+
+class URLMatcher(object):
+    """Match a URL against parsers in their registered order.
+
+    The URL_PATTERN of every parser that does not customize check_url is
+    wrapped in a named group, and joined into one alternation regex. One
+    search finds the leftmost match, where the first registered parser
+    wins a tie. Only when an earlier registered parser could still match
+    further in the URL, it is checked on the rest of the URL. Parsers
+    with a custom check_url are called in between.
+    """
+
+    def __init__(self, parsers):
+        # a list of compiled regexes and parsers with custom check_url
+        self.steps = []
+        group = []
+        for Parser in parsers:
+            if _uses_url_pattern(Parser):
+                pattern = Parser.URL_PATTERN
+                if pattern is None:
+                    # it never matches
+                    continue
+                if _can_combine(pattern):
+                    group.append(Parser)
+                    continue
+            self._add_group(group)
+            group = []
+            self.steps.append(Parser)
+        self._add_group(group)
+
+    def _add_group(self, parsers):
+        if not parsers:
+            return
+        regex = _combine_patterns(parsers)
+        if regex is None:
+            self.steps.extend(parsers)
+        else:
+            self.steps.append((regex, parsers))
+
+    def match(self, url):
+        for step in self.steps:
+            if isinstance(step, tuple):
+                regex, parsers = step
+                m = regex.search(url)
+                if m:
+                    return _first_match(url, m, parsers)
+            elif step.check_url(url):
+                return step
+
+
+def _can_match_url(Parser):
+    # every Parser has check_url, the default one needs a URL_PATTERN
+    if not hasattr(Parser, 'check_url'):
+        return False
+    if getattr(Parser, 'URL_PATTERN', None) is not None:
+        return True
+    return not _uses_url_pattern(Parser)
+
+
+def _uses_url_pattern(Parser):
+    check_url = getattr(Parser.check_url, '__func__', None)
+    return check_url is BaseParser.check_url.__func__
+
+
+def _can_combine(pattern):
+    if not isinstance(pattern.pattern, str) or pattern.flags & re.ASCII:
+        return False
+    return not NUMBERED_REFERENCE.search(pattern.pattern)
+
+
+def _combine_patterns(parsers):
+    parts = []
+    for i, Parser in enumerate(parsers):
+        pattern = Parser.URL_PATTERN
+        flags = ''
+        for flag, name in INLINE_FLAGS:
+            if pattern.flags & flag:
+                flags += name
+        if flags:
+            value = '(?{}:{})'.format(flags, pattern.pattern)
+        else:
+            value = pattern.pattern
+        parts.append('(?P<{}{}>{})'.format(GROUP_PREFIX, i, value))
+
+    try:
+        return re.compile('|'.join(parts))
+    except re.error:
+        # e.g. clashing group names, they are checked one by one
+        return None
+
+
+def _first_match(url, m, parsers):
+    index = int(m.lastgroup[len(GROUP_PREFIX):])
+    # parsers registered before the matched one, they did not match at
+    # or before the start of this match, but may match after it
+    start = m.start() + 1
+    for Parser in parsers[:index]:
+        if Parser.URL_PATTERN.search(url, start):
+            return Parser
+    return parsers[index]
+
+
+def iter_domains(host):
+    """Yield host and its parent domains, e.g. for ``a.example.com``,
+    ``a.example.com``, ``example.com`` and ``com``."""
+    if not host:
+        return
+    parts = host.split('.')
+    for i in range(len(parts)):
+        yield '.'.join(parts[i:])
+
+
+def iter_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # pkg_resources is slow to import, it is only a fallback
+        import pkg_resources
+        return pkg_resources.iter_entry_points(group)
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=group)
+    return eps.get(group, [])
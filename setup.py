@@ -31,6 +31,7 @@ setup(
     packages=[
         'getbook',
         'getbook.core',
+        'getbook.core.lxml_engine',
         'getbook.sites',
         'getbook.ebook',
     ],
@@ -45,6 +46,7 @@ setup(
     platforms='any',
     long_description=readme,
     license='GNU AGPLv3+',
+    python_requires='>=3.7',
     install_requires=install_requirements,
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -53,8 +55,6 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ]